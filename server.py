@@ -631,6 +631,18 @@ def main():
     @app.on_event("startup")
     async def startup_event():
         await startup_tasks()
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        from warp2protobuf.warp.api_client import close_client
+        from warp_request_handler import close_request_handler
+        from warp_token_manager import shutdown_token_services
+        from warp_token_pool import shutdown_token_pool
+        # 先停池：补充任务停止后才不会再部署 Worker 或使用已关闭的共享客户端
+        await shutdown_token_pool()
+        await shutdown_token_services()
+        await close_client()
+        await close_request_handler()
     
     # 启动服务器
     try:
@@ -37,14 +37,26 @@ def decode_jwt_payload(token: str) -> dict:
         return {}
 
 
-def is_token_expired(token: str, buffer_minutes: int = 5) -> bool:
+_BUFFER_15_MIN = 900
+_BUFFER_5_MIN = 300
+
+
+def _jwt_exp_minus(token: str, now: float):
+    """Return seconds left before the token's `exp`, or None if it has no exp.
+
+    JWT `exp` is a wall-clock unix timestamp, so `now` must come from time.time().
+    """
     payload = decode_jwt_payload(token)
     if not payload or 'exp' not in payload:
+        return None
+    return payload['exp'] - now
+
+
+def is_token_expired(token: str, buffer_seconds: int = _BUFFER_5_MIN, now: float = None) -> bool:
+    remaining = _jwt_exp_minus(token, time.time() if now is None else now)
+    if remaining is None:
         return True
-    expiry_time = payload['exp']
-    current_time = time.time()
-    buffer_time = buffer_minutes * 60
-    return (expiry_time - current_time) <= buffer_time
+    return remaining <= buffer_seconds
 
 
 async def refresh_jwt_token() -> dict:
@@ -68,7 +80,6 @@ async def refresh_jwt_token() -> dict:
         "content-type": "application/x-www-form-urlencoded",
         "accept": "*/*",
         "accept-encoding": "gzip, br",
-        "content-length": str(len(payload))
     }
     try:
         async with httpx.AsyncClient(timeout=30.0) as client:
@@ -90,10 +101,11 @@ async def refresh_jwt_token() -> dict:
         return {}
 
 
-def update_env_file(new_jwt: str) -> bool:
+async def update_env_file(new_jwt: str) -> bool:
     env_path = Path(".env")
     try:
-        set_key(str(env_path), "WARP_JWT", new_jwt)
+        # set_key 是同步磁盘 I/O，放到线程中执行避免阻塞事件循环
+        await asyncio.to_thread(set_key, str(env_path), "WARP_JWT", new_jwt)
         logger.info("Updated .env file with new JWT token")
         return True
     except Exception as e:
@@ -101,10 +113,10 @@ def update_env_file(new_jwt: str) -> bool:
         return False
 
 
-def update_env_refresh_token(refresh_token: str) -> bool:
+async def update_env_refresh_token(refresh_token: str) -> bool:
     env_path = Path(".env")
     try:
-        set_key(str(env_path), "WARP_REFRESH_TOKEN", refresh_token)
+        await asyncio.to_thread(set_key, str(env_path), "WARP_REFRESH_TOKEN", refresh_token)
         logger.info("Updated .env with WARP_REFRESH_TOKEN")
         return True
     except Exception as e:
@@ -112,23 +124,52 @@ def update_env_refresh_token(refresh_token: str) -> bool:
         return False
 
 
+# 正在进行中的刷新任务：并发的过期检测共享同一次上游刷新请求
+_refresh_inflight = None
+
+
+def _clear_refresh_inflight(task: asyncio.Task) -> None:
+    global _refresh_inflight
+    if _refresh_inflight is task:
+        _refresh_inflight = None
+
+
+async def _refresh_jwt_token_shared() -> dict:
+    """Single-flight wrapper around refresh_jwt_token.
+
+    The check-and-set below has no await point, so it is atomic on the event loop.
+    """
+    global _refresh_inflight
+    task = _refresh_inflight
+    if task is None:
+        task = asyncio.create_task(refresh_jwt_token())
+        task.add_done_callback(_clear_refresh_inflight)
+        _refresh_inflight = task
+    else:
+        logger.debug("JWT refresh already in flight, waiting for it")
+    # shield: 某个调用方被取消时不应取消其他调用方共享的刷新
+    return await asyncio.shield(task)
+
+
 async def check_and_refresh_token() -> bool:
     current_jwt = os.getenv("WARP_JWT")
     if not current_jwt:
         logger.warning("No JWT token found in environment")
-        token_data = await refresh_jwt_token()
+        token_data = await _refresh_jwt_token_shared()
         if token_data and "access_token" in token_data:
-            return update_env_file(token_data["access_token"])
+            return await update_env_file(token_data["access_token"])
         return False
     logger.debug("Checking current JWT token expiration...")
-    if is_token_expired(current_jwt, buffer_minutes=15):
+    now = time.time()
+    time_left = _jwt_exp_minus(current_jwt, now)
+    if time_left is None or time_left <= _BUFFER_15_MIN:
         logger.info("JWT token is expired or expiring soon, refreshing...")
-        token_data = await refresh_jwt_token()
+        token_data = await _refresh_jwt_token_shared()
         if token_data and "access_token" in token_data:
             new_jwt = token_data["access_token"]
-            if not is_token_expired(new_jwt, buffer_minutes=0):
+            if not is_token_expired(new_jwt, buffer_seconds=0):
                 logger.info("New token is valid")
-                return update_env_file(new_jwt)
+                return await update_env_file(new_jwt)
             else:
                 logger.warning("New token appears to be invalid or expired")
                 return False
@@ -136,14 +177,7 @@ async def check_and_refresh_token() -> bool:
             logger.error("Failed to get new token from refresh")
             return False
     else:
-        payload = decode_jwt_payload(current_jwt)
-        if payload and 'exp' in payload:
-            expiry_time = payload['exp']
-            time_left = expiry_time - time.time()
-            hours_left = time_left / 3600
-            logger.debug(f"Current token is still valid ({hours_left:.1f} hours remaining)")
-        else:
-            logger.debug("Current token appears valid")
+        logger.debug(f"Current token is still valid ({time_left / 3600:.1f} hours remaining)")
         return True
 
 
@@ -202,36 +236,31 @@ def _extract_google_api_key_from_refresh_url() -> str:
         return ""
 
 
-async def _create_anonymous_user() -> dict:
-    headers = {
-        "accept-encoding": "gzip, br",
-        "content-type": "application/json",
-        "x-warp-client-version": CLIENT_VERSION,
-        "x-warp-os-category": OS_CATEGORY,
-        "x-warp-os-name": OS_NAME,
-        "x-warp-os-version": OS_VERSION,
-    }
-    # GraphQL payload per anonymous.MD
-    query = (
-        "mutation CreateAnonymousUser($input: CreateAnonymousUserInput!, $requestContext: RequestContext!) {\n"
-        "  createAnonymousUser(input: $input, requestContext: $requestContext) {\n"
-        "    __typename\n"
-        "    ... on CreateAnonymousUserOutput {\n"
-        "      expiresAt\n"
-        "      anonymousUserType\n"
-        "      firebaseUid\n"
-        "      idToken\n"
-        "      isInviteValid\n"
-        "      responseContext { serverVersion }\n"
-        "    }\n"
-        "    ... on UserFacingError {\n"
-        "      error { __typename message }\n"
-        "      responseContext { serverVersion }\n"
-        "    }\n"
-        "  }\n"
-        "}\n"
-    )
-    variables = {
+_ANON_GQL_QUERY = (
+    "mutation CreateAnonymousUser($input: CreateAnonymousUserInput!, $requestContext: RequestContext!) {\n"
+    "  createAnonymousUser(input: $input, requestContext: $requestContext) {\n"
+    "    __typename\n"
+    "    ... on CreateAnonymousUserOutput {\n"
+    "      expiresAt\n"
+    "      anonymousUserType\n"
+    "      firebaseUid\n"
+    "      idToken\n"
+    "      isInviteValid\n"
+    "      responseContext { serverVersion }\n"
+    "    }\n"
+    "    ... on UserFacingError {\n"
+    "      error { __typename message }\n"
+    "      responseContext { serverVersion }\n"
+    "    }\n"
+    "  }\n"
+    "}\n"
+)
+
+# GraphQL payload per anonymous.MD; all variables are import-time constants,
+# so the request body is serialized once here.
+_ANON_BODY_TEMPLATE = json.dumps({
+    "query": _ANON_GQL_QUERY,
+    "variables": {
         "input": {
             "anonymousUserType": "NATIVE_CLIENT_ANONYMOUS_USER_FEATURE_GATED",
             "expirationType": "NO_EXPIRATION",
@@ -246,10 +275,22 @@ async def _create_anonymous_user() -> dict:
                 "version": OS_VERSION,
             }
         }
+    },
+    "operationName": "CreateAnonymousUser",
+}).encode("utf-8")
+
+
+async def _create_anonymous_user() -> dict:
+    headers = {
+        "accept-encoding": "gzip, br",
+        "content-type": "application/json",
+        "x-warp-client-version": CLIENT_VERSION,
+        "x-warp-os-category": OS_CATEGORY,
+        "x-warp-os-name": OS_NAME,
+        "x-warp-os-version": OS_VERSION,
     }
-    body = {"query": query, "variables": variables, "operationName": "CreateAnonymousUser"}
     async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
-        resp = await client.post(_ANON_GQL_URL, headers=headers, json=body)
+        resp = await client.post(_ANON_GQL_URL, headers=headers, content=_ANON_BODY_TEMPLATE)
         if resp.status_code != 200:
             raise RuntimeError(f"CreateAnonymousUser failed: HTTP {resp.status_code} {resp.text[:200]}")
         data = resp.json()
@@ -297,55 +338,31 @@ async def acquire_anonymous_access_token() -> str:
         logger.info("尝试从 Token 池获取 token...")
         token = await get_pooled_token()
         logger.info("成功从 Token 池获取 token")
-        update_env_file(token)
+        await update_env_file(token)
         return token
 
     except Exception as e:
-        logger.warning(f"Token 池获取失败: {e}，尝试多账号服务")
+        logger.warning(f"Token 池获取失败: {e}，尝试 Cloudflare Worker 服务")
 
-        # 回退到多账号服务
+        # 回退到 Cloudflare Worker 服务（进程级单例：多账号优先，否则单账号），
+        # 复用其常驻 Worker 与连接，避免每次调用都部署新 Worker
         try:
-            logger.info("尝试使用多账号服务获取 token...")
+            logger.info("尝试使用 Cloudflare Worker 服务获取 token...")
 
-            # 导入多账号服务
-            from warp_token_manager import MultiAccountTokenService
+            from warp_token_manager import get_token_service
 
-            # MultiAccountTokenService 会自动从环境变量加载配置
-            multi_service = MultiAccountTokenService()
-            access_token = await multi_service.acquire_fresh_token()
+            service = get_token_service()
+            access_token = await service.acquire_fresh_token()
 
             if access_token:
-                logger.info("通过多账号服务成功获取 token")
-                update_env_file(access_token)
+                logger.info("通过 Cloudflare Worker 服务成功获取 token")
+                await update_env_file(access_token)
                 return access_token
             else:
-                logger.warning("多账号服务获取失败，尝试单账号服务")
+                logger.warning("Cloudflare Worker 服务获取失败，回退到直接请求")
 
         except Exception as e2:
-            logger.warning(f"多账号服务失败: {e2}，尝试单账号服务")
-
-            # 回退到单账号服务（向后兼容）
-            cf_api_token = os.getenv("CLOUDFLARE_API_TOKEN")
-            cf_account_id = os.getenv("CLOUDFLARE_ACCOUNT_ID")
-
-            if cf_api_token and cf_account_id:
-                try:
-                    logger.info("尝试使用单账号 Cloudflare Worker 获取 token...")
-
-                    from warp_token_manager import WarpTokenService
-
-                    service = WarpTokenService(cf_api_token, cf_account_id)
-                    access_token = await service.acquire_fresh_token()
-
-                    if access_token:
-                        logger.info("通过单账号 Cloudflare Worker 成功获取 token")
-                        update_env_file(access_token)
-                        return access_token
-                    else:
-                        logger.warning("单账号 Cloudflare Worker 方案失败，回退到直接请求")
-
-                except Exception as e3:
-                    logger.warning(f"单账号 Cloudflare Worker 方案失败: {e3}，回退到直接请求")
+            logger.warning(f"Cloudflare Worker 服务失败: {e2}，回退到直接请求")
 
     # 回退到原始的直接请求方案
     logger.info("使用直接请求方案获取匿名访问令牌...")
@@ -366,7 +383,7 @@ async def acquire_anonymous_access_token() -> str:
             raise RuntimeError(f"signInWithCustomToken did not return refreshToken: {signin}")
 
         # Persist refresh token for future time-based refreshes
-        update_env_refresh_token(refresh_token)
+        await update_env_refresh_token(refresh_token)
 
         # Now call Warp proxy token endpoint to get access_token using this refresh token
         payload = f"grant_type=refresh_token&refresh_token={refresh_token}".encode("utf-8")
@@ -378,7 +395,6 @@ async def acquire_anonymous_access_token() -> str:
             "content-type": "application/x-www-form-urlencoded",
             "accept": "*/*",
             "accept-encoding": "gzip, br",
-            "content-length": str(len(payload))
         }
         async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
             resp = await client.post(REFRESH_URL, headers=headers, content=payload)
@@ -388,7 +404,7 @@ async def acquire_anonymous_access_token() -> str:
             access = token_data.get("access_token")
             if not access:
                 raise RuntimeError(f"No access_token in response: {token_data}")
-            update_env_file(access)
+            await update_env_file(access)
             return access
 
     except Exception as e:
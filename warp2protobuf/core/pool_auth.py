@@ -80,7 +80,7 @@ class PoolAuthManager:
                     return None
 
                 # 更新环境变量（兼容旧代码）
-                update_env_file(access_token)
+                await update_env_file(access_token)
 
                 return {
                     "session_id": session_id,
@@ -128,7 +128,6 @@ class PoolAuthManager:
             "content-type": "application/x-www-form-urlencoded",
             "accept": "*/*",
             "accept-encoding": "gzip, br",
-            "content-length": str(len(payload))
         }
 
         proxy_manager = AsyncProxyManager()
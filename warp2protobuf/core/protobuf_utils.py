@@ -24,9 +24,27 @@ def protobuf_to_dict(protobuf_bytes: bytes, message_type: str) -> Dict:
     
     try:
         MessageClass = msg_cls(message_type)
-        message = MessageClass()
+    except Exception as e:
+        logger.error(f"Protobuf解码失败: {e}")
+        raise HTTPException(500, f"Protobuf解码失败: {e}")
+    return protobuf_to_dict_cls(protobuf_bytes, MessageClass)
+
+
+
+def protobuf_to_dict_cls(protobuf_bytes: bytes, message_cls: Any) -> Dict:
+    """将protobuf字节转换为字典（调用方已持有消息类，跳过按名称查找）"""
+    try:
+        message = message_cls()
         message.ParseFromString(protobuf_bytes)
-        
+    except Exception as e:
+        logger.error(f"Protobuf解码失败: {e}")
+        raise HTTPException(500, f"Protobuf解码失败: {e}")
+    return protobuf_message_to_dict(message)
+
+
+def protobuf_message_to_dict(message: Any) -> Dict:
+    """将已解析的protobuf消息转换为字典（调用方已解析过字节时避免重复解析）"""
+    try:
         data = MessageToDict(message, preserving_proto_field_name=True)
         
         # 在转换阶段自动解析 server_message_data（Base64URL -> 结构化对象）
@@ -18,11 +18,9 @@ class AsyncProxyManager:
 
     async def cleanup_expired_identifiers(self):
         """清理过期的IP标识"""
+        # 单次重建字典并整体替换：过程中没有 await，无需持锁
         current_time = datetime.now()
-        async with self.lock:
-            expired_keys = [k for k, v in self.used_identifiers.items() if v < current_time]
-            for key in expired_keys:
-                del self.used_identifiers[key]
+        self.used_identifiers = {k: v for k, v in self.used_identifiers.items() if v >= current_time}
 
     async def get_proxy(self) -> Optional[str]:
         """
@@ -9,19 +9,97 @@ Warp 请求处理器 - 带自动 Token 切换
 
 import asyncio
 import httpx
+import importlib
+import random
+import time
+from email.utils import parsedate_to_datetime
 from typing import Optional, Dict, Any, Callable
 import json
 
 from warp2protobuf.core.logging import logger
 
+# 退避等待上限（秒）
+MAX_BACKOFF_SECONDS = 30.0
+# 切换到备用 token 后重试前的最大抖动（秒）
+SWITCH_RETRY_JITTER_SECONDS = 0.1
+
+# Token 池模块缓存：None 表示尚未导入，False 表示不可用
+_pool_module = None
+
+
+def _get_pool():
+    """懒加载 warp_token_pool 模块（与本模块同在项目根目录），只导入一次"""
+    global _pool_module
+    if _pool_module is None:
+        try:
+            _pool_module = importlib.import_module("warp_token_pool")
+        except ImportError as e:
+            logger.debug("Token 池模块不可用: %s", e)
+            _pool_module = False
+    return _pool_module or None
+
+
+def _backoff_delay(attempt: int) -> float:
+    """指数退避 + 抖动，避免多个请求同步重试"""
+    return min(MAX_BACKOFF_SECONDS, (2 ** attempt) + random.random() * 0.5)
+
+
+def _retry_after_delay(response: httpx.Response, attempt: int) -> float:
+    """解析 Retry-After（秒数或 HTTP 日期），无法解析时回退到指数退避"""
+    value = response.headers.get("Retry-After")
+    if value:
+        try:
+            return min(MAX_BACKOFF_SECONDS, max(0.0, float(value)))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value).timestamp()
+            return min(MAX_BACKOFF_SECONDS, max(0.0, retry_at - time.time()))
+        except (TypeError, ValueError):
+            pass
+    return _backoff_delay(attempt)
+
 
 class WarpRequestHandler:
     """Warp 请求处理器，支持自动 Token 切换"""
 
     def __init__(self):
         self.current_token: Optional[str] = None
+        # 仅在 token 变化时重建的鉴权头
+        self._auth_header: Dict[str, str] = {}
+        self._token_preview: Optional[str] = None
         self.retry_count = 0
         self.max_retries = 2
+        # 复用同一个 HTTP/2 客户端，避免每次请求重新握手
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+        # 单飞刷新：并发的刷新请求共享同一次获取结果
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def _ensure_client(self) -> httpx.AsyncClient:
+        """懒加载共享的 httpx 客户端"""
+        if self._client is not None and not self._client.is_closed:
+            return self._client
+        async with self._client_lock:
+            if self._client is None or self._client.is_closed:
+                self._client = httpx.AsyncClient(
+                    http2=True,
+                    timeout=30.0,
+                    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+                )
+        return self._client
+
+    def _set_token(self, token: Optional[str]):
+        """更新当前 token 并同步缓存的 Authorization 头"""
+        self.current_token = token
+        self._auth_header = {"Authorization": f"Bearer {token}"} if token else {}
+        self._token_preview = f"{token[:50]}..." if token else None
+
+    async def aclose(self):
+        """关闭共享的 httpx 客户端"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     async def make_request(
         self,
@@ -51,48 +129,49 @@ class WarpRequestHandler:
         Raises:
             Exception: 请求失败
         """
-        headers = headers or {}
-
         # 确保有 token
         if not self.current_token:
             await self._refresh_token()
 
-        # 设置 Authorization 头
-        if self.current_token:
-            headers["Authorization"] = f"Bearer {self.current_token}"
+        # 合并请求头（调用方传入的头优先，且不修改调用方的字典）
+        request_headers = {**self._auth_header, **(headers or {})}
 
         for attempt in range(self.max_retries + 1):
             try:
-                async with httpx.AsyncClient(timeout=timeout) as client:
-                    # 发送请求
-                    if json_data:
-                        response = await client.request(
-                            method, url, headers=headers, json=json_data, **kwargs
-                        )
-                    else:
-                        response = await client.request(
-                            method, url, headers=headers, data=data, **kwargs
-                        )
-
-                    # 检查是否是 429 错误
-                    if response.status_code == 429:
-                        logger.warning(f"遇到 429 错误 (尝试 {attempt + 1}/{self.max_retries + 1})")
-
-                        if attempt < self.max_retries:
-                            # 尝试切换 token
-                            success = await self._handle_rate_limit()
-                            if success:
-                                # 更新 Authorization 头
-                                headers["Authorization"] = f"Bearer {self.current_token}"
-                                logger.info("已切换到备用 token，重试请求...")
-                                continue
-                            else:
-                                logger.error("无法获取备用 token")
+                client = await self._ensure_client()
+                # 发送请求
+                if json_data:
+                    response = await client.request(
+                        method, url, headers=request_headers, json=json_data, timeout=timeout, **kwargs
+                    )
+                else:
+                    response = await client.request(
+                        method, url, headers=request_headers, data=data, timeout=timeout, **kwargs
+                    )
+
+                # 检查是否是 429 错误
+                if response.status_code == 429:
+                    logger.warning(f"遇到 429 错误 (尝试 {attempt + 1}/{self.max_retries + 1})")
+
+                    if attempt < self.max_retries:
+                        # 尝试切换 token
+                        success = await self._handle_rate_limit()
+                        if success:
+                            # 更新 Authorization 头；Retry-After 属于被限流的旧 token，换 token 后只加少量抖动
+                            request_headers = {**self._auth_header, **(headers or {})}
+                            delay = random.random() * SWITCH_RETRY_JITTER_SECONDS
+                            logger.info("已切换到备用 token，立即重试请求...")
                         else:
-                            logger.error("已达到最大重试次数，返回 429 错误")
+                            # 仍用原 token 重试，需遵守 Retry-After / 指数退避
+                            delay = _retry_after_delay(response, attempt)
+                            logger.error("无法获取备用 token，%.2f 秒后使用原 token 重试", delay)
+                        await asyncio.sleep(delay)
+                        continue
+                    else:
+                        logger.error("已达到最大重试次数，返回 429 错误")
 
-                    # 成功或其他错误，直接返回
-                    return response
+                # 成功或其他错误，直接返回
+                return response
 
             except Exception as e:
                 logger.error(f"请求异常 (尝试 {attempt + 1}/{self.max_retries + 1}): {e}")
@@ -100,33 +179,46 @@ class WarpRequestHandler:
                     raise
 
                 # 等待后重试
-                await asyncio.sleep(1)
+                await asyncio.sleep(_backoff_delay(attempt))
 
         # 不应该到达这里
         raise Exception("请求失败，已达到最大重试次数")
 
+    def _clear_refresh_task(self, task: asyncio.Task) -> None:
+        if self._refresh_task is task:
+            self._refresh_task = None
+
     async def _refresh_token(self) -> bool:
-        """刷新当前 token"""
-        try:
-            # 导入 Token 池管理器
-            import sys
-            import os
-            from pathlib import Path
-            project_root = Path(__file__).parent
-            sys.path.insert(0, str(project_root))
+        """刷新当前 token（并发调用只触发一次实际刷新）
 
+        检查与创建任务之间没有 await，在事件循环内是原子的。
+        """
+        task = self._refresh_task
+        if task is None:
+            task = asyncio.create_task(self._do_refresh_token())
+            task.add_done_callback(self._clear_refresh_task)
+            self._refresh_task = task
+        else:
+            logger.debug("token 刷新已在进行中，等待其结果")
+        # shield: 某个调用方被取消时不应取消其他调用方共享的刷新
+        return await asyncio.shield(task)
+
+    async def _do_refresh_token(self) -> bool:
+        """实际执行 token 获取"""
+        try:
             # 优先使用 Token 池
-            try:
-                from warp_token_pool import get_pooled_token
-                self.current_token = await get_pooled_token()
-                logger.debug("从 Token 池获取新 token")
-                return True
-            except Exception as pool_error:
-                logger.debug(f"Token 池不可用: {pool_error}")
+            pool = _get_pool()
+            if pool:
+                try:
+                    self._set_token(await pool.get_pooled_token())
+                    logger.debug("从 Token 池获取新 token")
+                    return True
+                except Exception as pool_error:
+                    logger.debug("Token 池不可用: %s", pool_error)
 
             # 回退到传统方法（已经包含多账号支持）
             from warp2protobuf.core.auth import get_valid_jwt
-            self.current_token = await get_valid_jwt()
+            self._set_token(await get_valid_jwt())
             logger.debug("使用传统方法获取 token")
             return True
 
@@ -138,15 +230,16 @@ class WarpRequestHandler:
         """处理 429 错误，切换到备用 token"""
         try:
             # 优先使用 Token 池的切换功能
-            try:
-                from warp_token_pool import handle_token_rate_limit
-                backup_token = await handle_token_rate_limit(self.current_token)
-                if backup_token:
-                    self.current_token = backup_token
-                    logger.info("成功切换到备用 token")
-                    return True
-            except Exception as pool_error:
-                logger.debug(f"Token 池切换失败: {pool_error}")
+            pool = _get_pool()
+            if pool:
+                try:
+                    backup_token = await pool.handle_token_rate_limit(self.current_token)
+                    if backup_token:
+                        self._set_token(backup_token)
+                        logger.info("成功切换到备用 token")
+                        return True
+                except Exception as pool_error:
+                    logger.debug("Token 池切换失败: %s", pool_error)
 
             # 回退到重新获取 token
             logger.info("重新获取 token...")
@@ -159,7 +252,7 @@ class WarpRequestHandler:
     def get_stats(self) -> Dict[str, Any]:
         """获取请求处理器统计信息"""
         return {
-            "current_token": self.current_token[:50] + "..." if self.current_token else None,
+            "current_token": self._token_preview,
             "retry_count": self.retry_count,
             "max_retries": self.max_retries
         }
@@ -189,6 +282,12 @@ def get_request_handler() -> WarpRequestHandler:
     return _request_handler
 
 
+async def close_request_handler():
+    """关闭全局请求处理器持有的 HTTP 客户端"""
+    if _request_handler is not None:
+        await _request_handler.aclose()
+
+
 # 便捷函数
 async def warp_request(method: str, url: str, **kwargs) -> httpx.Response:
     """便捷函数：发送 Warp 请求，自动处理 token 切换"""
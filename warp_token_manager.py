@@ -3,14 +3,17 @@
 """
 Warp Token 自动化管理系统
 
-通过动态部署和销毁 Cloudflare Workers 来绕过 IP 限制，
+通过在 Cloudflare Workers 上获取 token 来绕过 IP 限制，
 实现无限制的 Warp 匿名 token 获取。
 
-核心流程：
-1. 生成随机 Worker 名称
-2. 部署 Worker 到 Cloudflare
-3. 调用 Worker 获取 token
-4. 删除 Worker 释放资源
+核心流程（默认常驻模式）：
+1. 每个账号首次获取时部署一个随机命名的常驻 Worker
+2. 之后每次获取只调用该 Worker 的 /token
+3. Worker 失效时删除并重新部署；服务关闭时统一删除
+
+CLOUDFLARE_WORKER_SINGLE_USE=true 时回退到一次性模式：
+每次部署临时 Worker → 获取 token → 后台删除 Worker。
+周期清理按前缀删除残留 Worker，但会跳过本进程正在使用的常驻 Worker。
 """
 
 import asyncio
@@ -18,103 +21,252 @@ import httpx
 import json
 import os
 import random
-import string
+import secrets
 import tempfile
 import time
+from collections import deque
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 
 from warp2protobuf.core.logging import logger
 
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+
+def _json_loads(data):
+    """JSON 解析：优先 orjson，缺失时回退标准库（orjson.JSONDecodeError 是 json.JSONDecodeError 的子类）"""
+    if _orjson is not None:
+        return _orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj):
+    """JSON 序列化：orjson 返回 bytes，标准库返回 str，两者 httpx multipart 都接受"""
+    if _orjson is not None:
+        return _orjson.dumps(obj)
+    return json.dumps(obj)
+
+
+def _json(resp: httpx.Response):
+    """解析 httpx 响应体"""
+    return _json_loads(resp.content)
+
+
+# 批量清理时遇到 429/流重置的最大派发轮数
+CLEANUP_MAX_ROUNDS = 4
+
+# Worker /token 响应体上限，以及错误日志中保留的响应前缀长度（字节）
+WORKER_RESPONSE_MAX_BYTES = 64 * 1024
+ERROR_BODY_PREVIEW_BYTES = 500
+
+
+def _body_preview(response: httpx.Response) -> str:
+    """只解码响应体前缀用于错误日志"""
+    return response.content[:ERROR_BODY_PREVIEW_BYTES].decode('utf-8', 'replace')
+
+
+async def _read_capped(response: httpx.Response, max_bytes: int) -> bytes:
+    """从流式响应中最多读取 max_bytes 字节，超出部分不再接收"""
+    buf = bytearray()
+    async for chunk in response.aiter_bytes():
+        buf += chunk
+        if len(buf) >= max_bytes:
+            break
+    return bytes(buf[:max_bytes])
+
+
+def _is_delete_success(response: httpx.Response) -> bool:
+    """DELETE /workers/scripts/{name} 是否成功：2xx（JSON 未显式失败）或 404（已不存在）"""
+    if response.status_code == 404:
+        return True
+    if response.status_code not in (200, 202, 204):
+        return False
+    try:
+        result = _json(response)
+    except Exception:
+        return True
+    return not (isinstance(result, dict) and result.get("success") is False)
+
+
+class CloudflareRateLimitError(Exception):
+    """Cloudflare API 返回 429；retry_after 为建议的等待秒数（未提供时为 None）"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """解析 Retry-After 头（Cloudflare API 返回秒数），无法解析时返回 None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _match_worker_names(workers: List[Dict[str, Any]], prefix: str) -> List[str]:
+    """从 scripts 列表中挑出名称匹配前缀的 Worker（对象一般包含 "id" 或 "name" 字段），
+    本进程登记中的常驻 Worker 不计入，避免清理时被误删"""
+    protected = {m._worker_name for m in _persistent_managers if m._worker_name}
+    return [
+        name for name in ((w.get("id") or w.get("name") or "") for w in workers)
+        if isinstance(name, str) and name.startswith(prefix) and name not in protected
+    ]
+
+
+# 进程级共享的 workers.dev 客户端：所有账号的 /token 请求复用同一组连接
+_shared_worker_client: Optional[httpx.AsyncClient] = None
+
+
+def get_shared_worker_client() -> httpx.AsyncClient:
+    """懒加载共享的 workers.dev 客户端（不携带任何 Cloudflare 凭据）"""
+    global _shared_worker_client
+    if _shared_worker_client is None or _shared_worker_client.is_closed:
+        _shared_worker_client = httpx.AsyncClient(
+            http2=True,
+            timeout=60.0,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        )
+    return _shared_worker_client
+
+
+async def close_shared_worker_client():
+    """关闭共享的 workers.dev 客户端"""
+    global _shared_worker_client
+    if _shared_worker_client is not None:
+        await _shared_worker_client.aclose()
+        _shared_worker_client = None
+
 
 class CloudflareWorkerManager:
     """Cloudflare Worker 自动化管理器"""
 
-    def __init__(self, cf_api_token: str, cf_account_id: str, cf_subdomain: str=""):
+    # Worker 脚本缓存: (mtime, 内容)
+    _script_cache: Optional[Tuple[float, str]] = None
+
+    def __init__(self, cf_api_token: str, cf_account_id: str, cf_subdomain: str="",
+                 worker_client: Optional[httpx.AsyncClient] = None):
         """
         初始化管理器
 
         Args:
             cf_api_token: Cloudflare API Token (需要 Workers:Edit 权限)
             cf_account_id: Cloudflare Account ID
+            worker_client: 访问 workers.dev 的共享客户端，由调用方负责关闭；
+                           不提供时自建并在 aclose() 时关闭
         """
         self.cf_api_token = cf_api_token
         self.cf_account_id = cf_account_id
         self.subdomain = cf_subdomain
+        self._subdomain_cache: Optional[str] = None
+        self._subdomain_lock = asyncio.Lock()
+        # 常驻 Worker（跨多次 token 获取复用）
+        self._worker_name: Optional[str] = None
+        self._worker_url: Optional[str] = None
+        self._worker_lock = asyncio.Lock()
         self.base_url = f"https://api.cloudflare.com/client/v4/accounts/{cf_account_id}"
         self.headers = {
             "Authorization": f"Bearer {cf_api_token}",
             "Content-Type": "application/json"
         }
+        # Cloudflare API 共用一个 HTTP/2 连接；默认头只带鉴权，
+        # Content-Type 由 json=/files= 自动设置，避免覆盖 multipart 边界
+        self._client = httpx.AsyncClient(
+            http2=True,
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {cf_api_token}"},
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=16, max_connections=32, keepalive_expiry=30),
+        )
+        # 访问 workers.dev 的客户端不能携带 Cloudflare API Token
+        self._owns_worker_client = worker_client is None
+        self._worker_client = worker_client or httpx.AsyncClient(http2=True, timeout=60.0)
+
+    async def aclose(self):
+        """关闭持有的 HTTP 客户端（注入的共享客户端不在此关闭）"""
+        await self._client.aclose()
+        if self._owns_worker_client:
+            await self._worker_client.aclose()
 
     def _generate_worker_name(self) -> str:
         """生成随机的 Worker 名称"""
-        timestamp = str(int(time.time()))
-        random_suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
-        return f"warp-token-{timestamp}-{random_suffix}"
+        return f"warp-token-{int(time.time())}-{secrets.token_hex(4)}"
 
     async def _get_workers_subdomain(self) -> str:
-        """获取 Workers subdomain - 优先使用配置的 subdomain"""
+        """获取 Workers subdomain - 优先使用配置的 subdomain，环境变量/API 解析结果按实例缓存"""
         # 1. 优先使用初始化时提供的 subdomain
         if self.subdomain:
-            logger.debug(f"使用配置的 subdomain: {self.subdomain}")
+            logger.debug("使用配置的 subdomain: %s", self.subdomain)
             return self.subdomain
 
+        if self._subdomain_cache:
+            return self._subdomain_cache
+
         # 2. 检查环境变量
         env_subdomain = os.getenv("CLOUDFLARE_WORKERS_SUBDOMAIN")
         if env_subdomain:
-            logger.debug(f"使用环境变量 subdomain: {env_subdomain}")
+            logger.debug("使用环境变量 subdomain: %s", env_subdomain)
+            self._subdomain_cache = env_subdomain
             return env_subdomain
 
-        # 3. 尝试 API 获取（可能会 404）
-        try:
-            url = f"{self.base_url}/workers/subdomain"
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, headers=self.headers)
+        # 并发部署时只让一个协程去请求 API，其余等待结果
+        async with self._subdomain_lock:
+            if self._subdomain_cache:
+                return self._subdomain_cache
+
+            # 3. 尝试 API 获取（可能会 404）
+            try:
+                response = await self._client.get("/workers/subdomain", timeout=10.0)
                 if response.status_code == 200:
-                    result = response.json()
+                    result = _json(response)
                     if result.get("success"):
                         subdomain = result["result"]["subdomain"]
-                        logger.debug(f"API 获取到 Workers subdomain: {subdomain}")
+                        logger.debug("API 获取到 Workers subdomain: %s", subdomain)
+                        self._subdomain_cache = subdomain
                         return subdomain
                     else:
                         logger.warning(f"API 获取 subdomain 失败: {result.get('errors')}")
                 else:
                     logger.warning(f"Workers subdomain API 返回 {response.status_code}，可能接口不存在")
-        except Exception as e:
-            logger.warning(f"API 获取 subdomain 失败: {e}")
+            except Exception as e:
+                logger.warning(f"API 获取 subdomain 失败: {e}")
 
-        # 4. 使用默认值
-        default_subdomain = "mucsbr"
-        logger.warning(f"使用默认 subdomain: {default_subdomain}")
-        logger.info("💡 建议设置环境变量 CLOUDFLARE_WORKERS_SUBDOMAIN 或在多账号配置中指定 subdomain")
-        return default_subdomain
+            # 4. 使用默认值（不缓存：接口暂时失败时下次仍会重新请求）
+            default_subdomain = "mucsbr"
+            logger.warning(f"使用默认 subdomain: {default_subdomain}")
+            logger.info("💡 建议设置环境变量 CLOUDFLARE_WORKERS_SUBDOMAIN 或在多账号配置中指定 subdomain")
+            return default_subdomain
 
     async def _enable_workers_dev_route(self, worker_name: str, subdomain: str) -> bool:
         """启用 Worker 的 workers.dev 路由"""
         try:
-            logger.info(f"正在启用 Worker 路由: {worker_name}")
+            logger.info("正在启用 Worker 路由: %s", worker_name)
 
-            url = f"{self.base_url}/workers/scripts/{worker_name}/subdomain"
+            url = f"/workers/scripts/{worker_name}/subdomain"
 
             payload = {
                 "enabled": True
             }
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, headers=self.headers, json=payload)
+            response = await self._client.post(url, json=payload)
 
-                if response.status_code in [200, 201]:
-                    result = response.json()
-                    if result.get("success"):
-                        logger.info(f"Worker 路由启用成功: {worker_name}")
-                        return True
-                    else:
-                        logger.error(f"启用路由失败: {result.get('errors')}")
-                        return False
+            if response.status_code in [200, 201]:
+                result = _json(response)
+                if result.get("success"):
+                    logger.info("Worker 路由启用成功: %s", worker_name)
+                    return True
                 else:
-                    logger.error(f"启用路由 API 调用失败: {response.status_code} {response.text}")
+                    logger.error(f"启用路由失败: {result.get('errors')}")
                     return False
+            else:
+                logger.error(f"启用路由 API 调用失败: {response.status_code} {_body_preview(response)}")
+                return False
 
         except Exception as e:
             logger.error(f"启用 Worker 路由时发生错误: {e}")
@@ -122,13 +274,26 @@ class CloudflareWorkerManager:
 
     async def _get_worker_script(self) -> str:
         """获取 Worker 脚本内容"""
+        return await self._load_script_cached()
+
+    @classmethod
+    async def _load_script_cached(cls) -> str:
+        """读取 Worker 脚本，按 mtime 缓存，所有实例共享"""
         # warp_token_manager.py 在项目根目录，cloudflare-worker.js 也在项目根目录
         script_path = Path(__file__).parent / "cloudflare-worker.js"
 
-        if not script_path.exists():
+        try:
+            mtime = script_path.stat().st_mtime
+        except FileNotFoundError:
             raise FileNotFoundError(f"Worker 脚本未找到: {script_path}")
 
-        return script_path.read_text(encoding='utf-8')
+        cached = cls._script_cache
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        content = await asyncio.to_thread(script_path.read_text, encoding='utf-8')
+        cls._script_cache = (mtime, content)
+        return content
 
     async def deploy_worker(self, worker_name: str) -> Dict[str, Any]:
         """
@@ -140,14 +305,14 @@ class CloudflareWorkerManager:
         Returns:
             部署结果，包含 Worker URL
         """
-        logger.info(f"正在部署 Worker: {worker_name}")
+        logger.info("正在部署 Worker: %s", worker_name)
 
         try:
             # 获取 Worker 脚本
             script_content = await self._get_worker_script()
 
             # 部署 Worker
-            url = f"{self.base_url}/workers/scripts/{worker_name}"
+            url = f"/workers/scripts/{worker_name}"
 
             # 使用新的 Workers API 格式
             metadata = {
@@ -157,47 +322,84 @@ class CloudflareWorkerManager:
             }
 
             files = {
-                'metadata': ('metadata.json', json.dumps(metadata), 'application/json'),
+                'metadata': ('metadata.json', _json_dumps(metadata), 'application/json'),
                 'worker.js': ('worker.js', script_content, 'application/javascript+module')
             }
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.put(
-                    url,
-                    headers={"Authorization": f"Bearer {self.cf_api_token}"},
-                    files=files
-                )
+            response = await self._client.put(url, files=files)
 
-                if response.status_code not in [200, 201]:
-                    raise Exception(f"Worker 部署失败: {response.status_code} {response.text}")
+            if response.status_code == 429:
+                raise CloudflareRateLimitError(
+                    f"Worker 部署被限流: {_body_preview(response)}",
+                    retry_after=_parse_retry_after(response),
+                )
+            if response.status_code not in [200, 201]:
+                raise Exception(f"Worker 部署失败: {response.status_code} {_body_preview(response)}")
 
-                result = response.json()
+            result = _json(response)
 
-                if not result.get("success"):
-                    errors = result.get("errors", [])
-                    raise Exception(f"Worker 部署失败: {errors}")
+            if not result.get("success"):
+                errors = result.get("errors", [])
+                raise Exception(f"Worker 部署失败: {errors}")
 
-                # 获取 Worker 的 subdomain
-                # 需要调用 API 获取账户的 workers subdomain
-                subdomain = await self._get_workers_subdomain()
-                worker_url = f"https://{worker_name}.{subdomain}.workers.dev"
+            # 获取 Worker 的 subdomain
+            # 需要调用 API 获取账户的 workers subdomain
+            subdomain = await self._get_workers_subdomain()
+            worker_url = f"https://{worker_name}.{subdomain}.workers.dev"
 
-                logger.info(f"Worker 部署成功: {worker_url}")
+            logger.info("Worker 部署成功: %s", worker_url)
 
-                # 启用 workers.dev 路由
-                await self._enable_workers_dev_route(worker_name, subdomain)
+            # 启用 workers.dev 路由
+            await self._enable_workers_dev_route(worker_name, subdomain)
 
-                return {
-                    "success": True,
-                    "worker_name": worker_name,
-                    "worker_url": worker_url,
-                    "script_id": result["result"]["id"]
-                }
+            return {
+                "success": True,
+                "worker_name": worker_name,
+                "worker_url": worker_url,
+                "script_id": result["result"]["id"]
+            }
 
         except Exception as e:
             logger.error(f"Worker 部署失败: {e}")
             raise
 
+    @property
+    def has_worker(self) -> bool:
+        """是否已有可复用的常驻 Worker"""
+        return self._worker_url is not None
+
+    async def ensure_worker(self) -> str:
+        """返回常驻 Worker 的 URL，尚未部署时部署一个"""
+        if self._worker_url is not None:
+            return self._worker_url
+        async with self._worker_lock:
+            if self._worker_url is None:
+                worker_name = self._generate_worker_name()
+                # 部署前先登记，周期清理不会删除正在部署的常驻 Worker
+                self._worker_name = worker_name
+                _persistent_managers.add(self)
+                try:
+                    deploy_result = await self.deploy_worker(worker_name)
+                except BaseException:
+                    self._worker_name = None
+                    _persistent_managers.discard(self)
+                    # 取消或失败可能发生在脚本上传之后：后台删除可能已存在的 Worker
+                    # （未上传时删除返回 404，视为成功），关闭时由 flush_pending_deletions 等待
+                    _track_background(asyncio.create_task(self.delete_worker(worker_name)))
+                    raise
+                self._worker_url = deploy_result["worker_url"]
+        return self._worker_url
+
+    async def discard_worker(self) -> bool:
+        """删除常驻 Worker（失效或服务关闭时），下次 ensure_worker 会重新部署"""
+        worker_name = self._worker_name
+        self._worker_name = None
+        self._worker_url = None
+        _persistent_managers.discard(self)
+        if not worker_name:
+            return True
+        return await self.delete_worker(worker_name)
+
     async def delete_worker(self, worker_name: str) -> bool:
         """
         删除 Worker
@@ -208,83 +410,86 @@ class CloudflareWorkerManager:
         Returns:
             是否删除成功
         """
-        logger.info(f"正在删除 Worker: {worker_name}")
+        logger.info("正在删除 Worker: %s", worker_name)
 
         try:
-            url = f"{self.base_url}/workers/scripts/{worker_name}"
-
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.delete(url, headers=self.headers)
-
-                if response.status_code in (200, 202, 204):
-                    # 200: 带 JSON 成功; 202/204: 已接受/无内容也视为成功
-                    try:
-                        result = response.json()
-                        if isinstance(result, dict) and result.get("success") is False:
-                            logger.error(f"Worker 删除失败: {result.get('errors')}")
-                            return False
-                    except Exception:
-                        pass
-                    logger.info(f"Worker 删除成功: {worker_name}")
-                    return True
-                elif response.status_code == 404:
-                    logger.warning(f"Worker 不存在，可能已被删除: {worker_name}")
-                    return True
-                else:
-                    logger.error(f"Worker 删除失败: {response.status_code} {response.text}")
-                    return False
+            response = await self._client.delete(f"/workers/scripts/{worker_name}")
+
+            if response.status_code in (200, 202, 204):
+                # 200: 带 JSON 成功; 202/204: 已接受/无内容也视为成功
+                try:
+                    result = _json(response)
+                    if isinstance(result, dict) and result.get("success") is False:
+                        logger.error(f"Worker 删除失败: {result.get('errors')}")
+                        return False
+                except Exception:
+                    pass
+                logger.info("Worker 删除成功: %s", worker_name)
+                return True
+            elif response.status_code == 404:
+                logger.warning(f"Worker 不存在，可能已被删除: {worker_name}")
+                return True
+            else:
+                logger.error(f"Worker 删除失败: {response.status_code} {_body_preview(response)}")
+                return False
 
         except Exception as e:
             logger.error(f"删除 Worker 时发生错误: {e}")
             return False
 
-    async def get_token_from_worker(self, worker_url: str, max_retries: int = 3) -> Optional[str]:
+    async def get_token_from_worker(self, worker_url: str, max_retries: int = 3, wait_for_deploy: bool = True) -> Optional[str]:
         """
         从 Worker 获取 token
 
         Args:
             worker_url: Worker URL
             max_retries: 最大重试次数
+            wait_for_deploy: 是否在第一次请求前等待 Worker 部署生效（刚部署时需要）
 
         Returns:
             获取到的 access token，失败返回 None
         """
-        logger.info(f"正在从 Worker 获取 token: {worker_url}")
+        logger.info("正在从 Worker 获取 token: %s", worker_url)
 
         for attempt in range(max_retries):
             try:
                 # 等待 Worker 完全部署（第一次尝试时）
-                if attempt == 0:
+                if attempt == 0 and wait_for_deploy:
                     await asyncio.sleep(2)
 
-                async with httpx.AsyncClient(timeout=60.0) as client:
-                    response = await client.get(f"{worker_url}/token")
-
-                    if response.status_code == 200:
-                        data = response.json()
-
-                        if data.get("success"):
-                            access_token = data.get("accessToken")
-                            if access_token:
-                                logger.info(f"成功获取 token: {access_token[:50]}...")
-                                return access_token
-                            else:
-                                logger.error("响应中未包含 accessToken")
-                                logger.error(f"完整响应: {data}")
+                # 流式读取并限制大小，避免 Worker 异常返回大页面时整包缓冲
+                async with self._worker_client.stream("GET", f"{worker_url}/token") as response:
+                    if response.status_code != 200:
+                        body = await _read_capped(response, ERROR_BODY_PREVIEW_BYTES)
+                        logger.error(f"HTTP 错误: {response.status_code}")
+                        logger.error(f"响应内容: {body.decode('utf-8', 'replace')}")
+                        data = None
+                    else:
+                        body = await _read_capped(response, WORKER_RESPONSE_MAX_BYTES + 1)
+                        if len(body) > WORKER_RESPONSE_MAX_BYTES:
+                            raise ValueError(f"Worker 响应超过 {WORKER_RESPONSE_MAX_BYTES} 字节")
+                        data = _json_loads(body)
+
+                if data is not None:
+                    if data.get("success"):
+                        access_token = data.get("accessToken")
+                        if access_token:
+                            logger.info("成功获取 token: %.50s...", access_token)
+                            return access_token
                         else:
-                            error_msg = data.get("error", "未知错误")
-                            logger.error(f"Worker 返回错误: {error_msg}")
+                            logger.error("响应中未包含 accessToken")
                             logger.error(f"完整响应: {data}")
                     else:
-                        logger.error(f"HTTP 错误: {response.status_code}")
-                        logger.error(f"响应内容: {response.text[:500]}")
+                        error_msg = data.get("error", "未知错误")
+                        logger.error(f"Worker 返回错误: {error_msg}")
+                        logger.error(f"完整响应: {data}")
 
             except Exception as e:
                 logger.error(f"第 {attempt + 1} 次尝试失败: {e}")
 
             if attempt < max_retries - 1:
-                wait_time = 2 ** attempt  # 指数退避
-                logger.info(f"等待 {wait_time} 秒后重试...")
+                wait_time = 2 ** attempt + random.random() * 0.5  # 指数退避 + 抖动
+                logger.info("等待 %.2f 秒后重试...", wait_time)
                 await asyncio.sleep(wait_time)
 
         logger.error("所有尝试均失败，无法获取 token")
@@ -295,82 +500,217 @@ class CloudflareWorkerManager:
     async def list_all_workers(self) -> List[Dict[str, Any]]:
         """列出账户下所有 scripts 形式的 Workers（单次请求）。"""
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                url = f"{self.base_url}/workers/scripts"
-                resp = await client.get(url, headers=self.headers)
-                if resp.status_code != 200:
-                    logger.error(f"列出 Workers 失败: {resp.status_code} {resp.text}")
-                    return []
-                data = resp.json()
-                if not data.get("success"):
-                    logger.error(f"列出 Workers 返回错误: {data.get('errors')}")
-                    return []
-                workers = data.get("result", [])
-                logger.info(f"共列出 {len(workers)} 个 Workers")
-                return workers
+            resp = await self._client.get("/workers/scripts")
+            if resp.status_code != 200:
+                logger.error(f"列出 Workers 失败: {resp.status_code} {_body_preview(resp)}")
+                return []
+            data = _json(resp)
+            if not data.get("success"):
+                logger.error(f"列出 Workers 返回错误: {data.get('errors')}")
+                return []
+            workers = data.get("result", [])
+            logger.info(f"共列出 {len(workers)} 个 Workers")
+            return workers
         except Exception as e:
             logger.error(f"列出 Workers 时发生异常: {e}")
             return []
 
-    async def cleanup_workers_by_prefix(self, prefix: str, threshold: Optional[int] = None, max_concurrency: int = 5) -> Dict[str, Any]:
+    async def cleanup_workers_by_prefix(self, prefix: str, threshold: Optional[int] = None, max_concurrency: int = 100) -> Dict[str, Any]:
         """
         按前缀批量清理 Workers。
         - prefix: 需要匹配的名前缀，例如 "warp-token-"
         - threshold: 若提供且当前匹配数量 <= threshold，则不清理（保护阈值）
-        - max_concurrency: 并发删除上限
+        - max_concurrency: 并发删除上限。删除请求共用一个 HTTP/2 连接多路复用，
+          默认 100 与 Cloudflare 常见的并发流上限一致，信号量只用于限制内存占用
         返回统计信息。
         """
-        workers = await self.list_all_workers()
-        targets = []
-        for w in workers:
-            # scripts 列表返回的对象中，一般包含 "id" 或 "name" 字段
-            name = w.get("id") or w.get("name") or ""
-            if isinstance(name, str) and name.startswith(prefix):
-                targets.append(name)
+        targets = _match_worker_names(await self.list_all_workers(), prefix)
         total = len(targets)
         if threshold is not None and total <= threshold:
             logger.info(f"匹配 {total} 个，未超过阈值 {threshold}，不执行清理")
             return {"matched": total, "deleted": 0, "skipped": total}
 
         logger.warning(f"开始清理 {total} 个匹配前缀 '{prefix}' 的 Workers")
+        return await self.delete_workers(targets, max_concurrency=max_concurrency)
 
-        sem = asyncio.Semaphore(max_concurrency)
+    async def delete_workers(self, names: List[str], max_concurrency: int = 100) -> Dict[str, Any]:
+        """
+        并发删除给定名称的 Workers（调用方已持有列表时可跳过再次 list）。
+        遇到 429 或传输错误时降低并发并退避重试。返回统计信息。
+        """
+        total = len(names)
         deleted = 0
+        failed = 0
+        pending = names
+        concurrency = max_concurrency
+
+        for round_no in range(CLEANUP_MAX_ROUNDS):
+            # 所有删除一次性派发到共享的 HTTP/2 连接上多路复用
+            sem = asyncio.Semaphore(concurrency)
+
+            async def _del(name: str) -> httpx.Response:
+                async with sem:
+                    return await self._client.delete(f"/workers/scripts/{name}")
+
+            results = await asyncio.gather(*[_del(n) for n in pending], return_exceptions=True)
+
+            retry = []
+            for name, r in zip(pending, results):
+                if isinstance(r, httpx.Response):
+                    if r.status_code == 429:
+                        retry.append(name)
+                    elif _is_delete_success(r):
+                        deleted += 1
+                    else:
+                        failed += 1
+                        logger.error(f"Worker 删除失败: {name} {r.status_code}")
+                elif isinstance(r, httpx.TransportError):
+                    # 流被重置 (RST_STREAM) 等传输错误，与 429 一样降速重试
+                    retry.append(name)
+                else:
+                    failed += 1
+                    logger.error(f"删除 Worker {name} 时发生错误: {r}")
+
+            if not retry:
+                break
+            pending = retry
+            if round_no < CLEANUP_MAX_ROUNDS - 1:
+                concurrency = max(1, concurrency // 2)
+                wait_time = 2 ** round_no + random.random() * 0.5
+                logger.warning(f"{len(retry)} 个 Worker 删除被限流，{wait_time:.2f} 秒后以并发 {concurrency} 重试")
+                await asyncio.sleep(wait_time)
+        else:
+            failed += len(pending)
+            logger.error(f"{len(pending)} 个 Worker 多次重试后仍被限流")
+
+        logger.info(f"清理完成：匹配 {total}，成功删除 {deleted}，失败 {failed}")
+        return {"matched": total, "deleted": deleted, "failed": failed}
+
+
+# ensure_valid_token 的过期缓冲（秒）
+TOKEN_EXPIRY_BUFFER = 300
+
+# 后台 Worker 删除/连接关闭任务；持有引用防止任务被 GC 回收
+_pending_deletions: set = set()
+
+# 持有常驻 Worker 的管理器，服务关闭时统一删除
+_persistent_managers: set = set()
+
+# 为 True 时每次获取都部署临时 Worker 并在用完后删除（禁止常驻 Worker 的环境）
+WORKER_SINGLE_USE = os.getenv("CLOUDFLARE_WORKER_SINGLE_USE", "false").lower() == "true"
+
+
+def _track_background(task: asyncio.Task) -> asyncio.Task:
+    """登记后台清理任务，完成后自动移除"""
+    _pending_deletions.add(task)
+    task.add_done_callback(_pending_deletions.discard)
+    return task
+
+
+async def flush_pending_deletions():
+    """等待所有后台 Worker 删除完成（用于服务关闭）"""
+    while _pending_deletions:
+        await asyncio.gather(*list(_pending_deletions), return_exceptions=True)
+
+
+async def teardown_persistent_workers():
+    """删除所有常驻 Worker（用于服务关闭）"""
+    managers = list(_persistent_managers)
+    if managers:
+        await asyncio.gather(*[m.discard_worker() for m in managers], return_exceptions=True)
+
+
+class _TokenExpiryCache:
+    """缓存 (token, exp)，同一 token 重复校验时只需比较时间，不再解析 JWT"""
 
-        async def _del(name: str) -> bool:
-            async with sem:
-                ok = await self.delete_worker(name)
-                return ok
+    _token_cache: Optional[Tuple[str, float]] = None
 
-        results = await asyncio.gather(*[_del(n) for n in targets], return_exceptions=True)
-        for r in results:
-            if r is True:
-                deleted += 1
-        logger.info(f"清理完成：匹配 {total}，成功删除 {deleted}，失败 {total - deleted}")
-        return {"matched": total, "deleted": deleted, "failed": total - deleted}
+    def _token_fresh(self, token: str) -> bool:
+        """token 在缓冲期外仍有效则返回 True；缓存未命中时解析一次 exp 并记录"""
+        now = time.time()
+        cache = self._token_cache
+        if cache is None or cache[0] != token:
+            self._remember_token(token)
+            cache = self._token_cache
+            if cache is None:
+                return False
+        return cache[1] - TOKEN_EXPIRY_BUFFER > now
 
+    def _remember_token(self, token: str):
+        """解析并缓存 token 的 exp；无 exp 的 token 不缓存"""
+        from warp2protobuf.core.auth import decode_jwt_payload
 
-class WarpTokenService:
+        exp = decode_jwt_payload(token).get("exp")
+        self._token_cache = (token, float(exp)) if exp is not None else None
+
+
+class WarpTokenService(_TokenExpiryCache):
     """Warp Token 服务 - 高级封装"""
 
-    def __init__(self, cf_api_token: str, cf_account_id: str, cf_subdomain: str=""):
-        self.worker_manager = CloudflareWorkerManager(cf_api_token, cf_account_id, cf_subdomain)
+    def __init__(self, cf_api_token: str, cf_account_id: str, cf_subdomain: str="", single_use: Optional[bool] = None,
+                 client: Optional[httpx.AsyncClient] = None):
+        self.worker_manager = CloudflareWorkerManager(cf_api_token, cf_account_id, cf_subdomain, worker_client=client)
+        self.single_use = WORKER_SINGLE_USE if single_use is None else single_use
+        self._pending_delete: Optional[asyncio.Task] = None
+
+    async def aclose(self):
+        """删除常驻 Worker，等后台删除结束后释放底层 Worker 管理器的连接"""
+        await self.worker_manager.discard_worker()
+        if self._pending_delete is not None:
+            await asyncio.gather(self._pending_delete, return_exceptions=True)
+        await self.worker_manager.aclose()
 
     async def acquire_fresh_token(self) -> Optional[str]:
         """
         获取新的 Warp 访问令牌
 
-        通过部署临时 Worker 获取 token，然后清理资源
+        默认复用常驻 Worker，只需一次 /token 调用；single_use 模式下
+        每次部署临时 Worker 获取 token，然后清理资源
 
         Returns:
             获取到的 access token，失败返回 None
         """
+        if self.single_use:
+            return await self._acquire_with_disposable_worker()
+        return await self._acquire_with_persistent_worker()
+
+    async def _acquire_with_persistent_worker(self) -> Optional[str]:
+        """通过常驻 Worker 获取 token，Worker 失效时重新部署一次"""
+        manager = self.worker_manager
+        try:
+            reused = manager.has_worker
+            worker_url = await manager.ensure_worker()
+            access_token = await manager.get_token_from_worker(worker_url, wait_for_deploy=not reused)
+
+            if not access_token and reused:
+                # 常驻 Worker 可能已被周期清理删除，重建后再试一次
+                logger.warning("常驻 Worker 获取 token 失败，重新部署")
+                await manager.discard_worker()
+                worker_url = await manager.ensure_worker()
+                access_token = await manager.get_token_from_worker(worker_url)
+
+            if access_token:
+                logger.info("成功获取新的 Warp 访问令牌")
+                return access_token
+            else:
+                logger.error("获取 token 失败")
+                return None
+
+        except CloudflareRateLimitError:
+            # 限流交给调用方按 retry_after 退避
+            raise
+        except Exception as e:
+            logger.error(f"获取 token 过程中发生错误: {e}")
+            return None
+
+    async def _acquire_with_disposable_worker(self) -> Optional[str]:
+        """部署临时 Worker 获取 token，用完即删"""
         worker_name = None
 
         try:
             # 1. 生成 Worker 名称
             worker_name = self.worker_manager._generate_worker_name()
-            logger.info(f"开始获取新 token，Worker 名称: {worker_name}")
+            logger.info("开始获取新 token，Worker 名称: %s", worker_name)
 
             # 2. 部署 Worker
             deploy_result = await self.worker_manager.deploy_worker(worker_name)
@@ -386,17 +726,20 @@ class WarpTokenService:
                 logger.error("获取 token 失败")
                 return None
 
+        except CloudflareRateLimitError:
+            # 限流交给调用方按 retry_after 退避
+            raise
         except Exception as e:
             logger.error(f"获取 token 过程中发生错误: {e}")
             return None
 
         finally:
             # 4. 清理 Worker（无论成功失败都要清理）
+            # 后台删除，不阻塞 token 返回；独立任务在本协程被取消（多账号竞速落败）时也会执行完
             if worker_name:
-                try:
-                    await self.worker_manager.delete_worker(worker_name)
-                except Exception as e:
-                    logger.error(f"清理 Worker 时发生错误: {e}")
+                self._pending_delete = _track_background(
+                    asyncio.create_task(self.worker_manager.delete_worker(worker_name))
+                )
 
     async def ensure_valid_token(self) -> str:
         """
@@ -410,12 +753,12 @@ class WarpTokenService:
         Raises:
             RuntimeError: 无法获取有效 token
         """
-        from .auth import get_jwt_token, is_token_expired
+        from warp2protobuf.core.auth import get_jwt_token, update_env_file
 
         # 检查现有 token
         current_token = get_jwt_token()
 
-        if current_token and not is_token_expired(current_token, buffer_minutes=5):
+        if current_token and self._token_fresh(current_token):
             logger.info("现有 token 仍然有效")
             return current_token
 
@@ -425,27 +768,28 @@ class WarpTokenService:
 
         if new_token:
             # 保存新 token
-            from .auth import update_env_file
-            update_env_file(new_token)
+            await update_env_file(new_token)
+            self._remember_token(new_token)
             return new_token
         else:
             raise RuntimeError("无法获取有效的 Warp 访问令牌")
 
 
-class MultiAccountTokenService:
+class MultiAccountTokenService(_TokenExpiryCache):
     """多账号轮换 Token 服务
 
     支持多个 Cloudflare 账号轮换使用，提高 token 获取成功率。
     每次请求使用不同的账号，避免单一账号的 IP 限制。
     """
 
-    def __init__(self, accounts: Optional[List[Dict[str, str]]] = None):
+    def __init__(self, accounts: Optional[List[Dict[str, str]]] = None, client: Optional[httpx.AsyncClient] = None):
         """
         初始化多账号服务
 
         Args:
             accounts: 账号列表，每个账号包含 api_token 和 account_id
                      如果不提供，将从环境变量加载
+            client: 各账号共享的 workers.dev 客户端（可选）
 
         Example:
             accounts = [
@@ -462,9 +806,21 @@ class MultiAccountTokenService:
         if not self.accounts:
             raise ValueError("至少需要配置一个 Cloudflare 账号")
 
+        # 热路径使用按位置索引的并列元组（避免反复的字典键查找）
+        self._api_tokens: Tuple[str, ...] = tuple(a['api_token'] for a in self.accounts)
+        self._account_ids: Tuple[str, ...] = tuple(a['account_id'] for a in self.accounts)
+        self._subdomains: Tuple[str, ...] = tuple(a.get('subdomain', '') for a in self.accounts)
+        # 日志用的账号 ID 截断形式，只生成一次
+        self._account_previews: Tuple[str, ...] = tuple(f"{aid[:8]}..." for aid in self._account_ids)
+
+        self._services: Dict[int, WarpTokenService] = {}
+        self._client = client
+
         self.current_index = 0
         self.lock = asyncio.Lock()
-        self.failed_accounts = set()  # 记录失败的账号索引
+        self._failed_mask: int = 0  # 失败账号位图，第 i 位对应账号 #i
+        # 可用账号索引队列：队头即下一个要用的账号，轮换为 O(1)
+        self._available: deque = deque(range(len(self.accounts)))
 
         logger.info(f"多账号服务初始化成功，共有 {len(self.accounts)} 个账号")
 
@@ -483,7 +839,7 @@ class MultiAccountTokenService:
         accounts_json = os.getenv("CLOUDFLARE_ACCOUNTS")
         if accounts_json:
             try:
-                accounts_data = json.loads(accounts_json)
+                accounts_data = _json_loads(accounts_json)
                 if isinstance(accounts_data, list):
                     accounts = accounts_data
                 logger.info(f"从 CLOUDFLARE_ACCOUNTS 加载了 {len(accounts)} 个账号")
@@ -535,88 +891,104 @@ class MultiAccountTokenService:
 
         Returns:
             账号信息字典，包含 api_token 和 account_id
-
-        Raises:
-            RuntimeError: 所有账号都不可用
         """
-        async with self.lock:
-            # 如果所有账号都失败了，重置失败列表（给它们第二次机会）
-            if len(self.failed_accounts) >= len(self.accounts):
-                logger.warning("所有账号都失败过，重置失败列表")
-                self.failed_accounts.clear()
-
-            # 寻找下一个未失败的账号
-            attempts = 0
-            while attempts < len(self.accounts):
-                account = self.accounts[self.current_index]
-
-                # 移动到下一个索引（轮换）
-                next_index = (self.current_index + 1) % len(self.accounts)
-
-                if self.current_index not in self.failed_accounts:
-                    self.current_index = next_index
-                    logger.debug(f"使用账号 #{self.current_index} ({account['account_id'][:8]}...)")
-                    return account
-
-                self.current_index = next_index
-                attempts += 1
-
-            raise RuntimeError("没有可用的 Cloudflare 账号")
+        idx = (await self._pick_k(1))[0]
+        logger.debug("使用账号 #%d (%s)", idx, self._account_previews[idx])
+        return self.accounts[idx]
 
-    async def mark_account_failed(self, account: Dict[str, str]):
+    async def mark_account_failed(self, account_id: str):
         """标记账号失败
 
         Args:
-            account: 失败的账号信息
+            account_id: 失败账号的 account_id
         """
+        try:
+            i = self._account_ids.index(account_id)
+        except ValueError:
+            return
+        await self._mark_index_failed(i)
+
+    async def _mark_index_failed(self, i: int):
+        """按索引标记账号失败"""
         async with self.lock:
-            # 找到账号索引
-            for i, acc in enumerate(self.accounts):
-                if acc['account_id'] == account['account_id']:
-                    self.failed_accounts.add(i)
-                    logger.warning(f"账号 #{i} ({account['account_id'][:8]}...) 被标记为失败")
-                    break
+            self._failed_mask |= 1 << i
+            try:
+                self._available.remove(i)
+            except ValueError:
+                pass
+        logger.warning("账号 #%d (%s) 被标记为失败", i, self._account_previews[i])
+
+    async def _pick_k(self, k: int) -> List[int]:
+        """一次取出最多 k 个互不相同的可用账号索引（同样按轮换顺序）"""
+        async with self.lock:
+            if not self._available:
+                logger.warning("所有账号都失败过，重置失败列表")
+                self._failed_mask = 0
+                self._available.extend(range(len(self.accounts)))
+
+            picked = []
+            for _ in range(min(k, len(self._available))):
+                idx = self._available.popleft()
+                self._available.append(idx)
+                picked.append(idx)
+            self.current_index = self._available[0]
+
+        return picked
+
+    def _get_service(self, idx: int) -> WarpTokenService:
+        """按账号缓存 WarpTokenService，复用其连接与常驻 Worker"""
+        service = self._services.get(idx)
+        if service is None:
+            service = WarpTokenService(
+                self._api_tokens[idx], self._account_ids[idx], self._subdomains[idx], client=self._client
+            )
+            self._services[idx] = service
+        return service
+
+    async def aclose(self):
+        """关闭所有账号的 Token 服务连接"""
+        services = list(self._services.values())
+        self._services.clear()
+        await asyncio.gather(*[svc.aclose() for svc in services], return_exceptions=True)
+
+    async def _try_account(self, idx: int) -> Optional[str]:
+        """用单个账号尝试获取 token，失败时标记该账号"""
+        preview = self._account_previews[idx]
+        service = self._get_service(idx)
+        try:
+            token = await service.acquire_fresh_token()
+            if token:
+                logger.info("成功从账号 %s 获取 token", preview)
+                return token
+            logger.warning("账号 %s 获取 token 失败", preview)
+            await self._mark_index_failed(idx)
+        except Exception as e:
+            logger.error(f"获取 token 时发生错误: {e}")
+            await self._mark_index_failed(idx)
+        return None
 
     async def acquire_fresh_token(self) -> Optional[str]:
         """获取新的 Warp 访问令牌（使用多账号轮换）
 
+        同时在最多 3 个不同账号上发起获取，返回最先成功的 token，
+        其余任务被取消（各自的 Worker 仍会在 finally 中清理）。
+
         Returns:
             获取到的 access token，失败返回 None
         """
-        max_retries = min(3, len(self.accounts))  # 最多重试次数不超过账号数
-
-        for attempt in range(max_retries):
-            try:
-                # 获取下一个账号
-                account = await self.get_next_account()
-
-                # 创建 token 服务实例
-                subdomain = account.get('subdomain', '')
-                service = WarpTokenService(
-                    account['api_token'],
-                    account['account_id'],
-                    subdomain
-                )
-
-                # 尝试获取 token
-                token = await service.acquire_fresh_token()
+        race_width = min(3, len(self.accounts))  # 并发账号数不超过账号总数
+        picked = await self._pick_k(race_width)
+        tasks = [asyncio.create_task(self._try_account(idx)) for idx in picked]
 
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                token = await next_done
                 if token:
-                    logger.info(f"成功从账号 {account['account_id'][:8]}... 获取 token")
                     return token
-                else:
-                    logger.warning(f"账号 {account['account_id'][:8]}... 获取 token 失败")
-                    await self.mark_account_failed(account)
-
-            except Exception as e:
-                logger.error(f"获取 token 时发生错误: {e}")
-                if 'account' in locals():
-                    await self.mark_account_failed(account)
-
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt  # 指数退避
-                logger.info(f"等待 {wait_time} 秒后重试...")
-                await asyncio.sleep(wait_time)
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
 
         logger.error("多账号轮换后仍无法获取 token")
         return None
@@ -630,12 +1002,12 @@ class MultiAccountTokenService:
         Raises:
             RuntimeError: 无法获取有效 token
         """
-        from warp2protobuf.core.auth import get_jwt_token, is_token_expired
+        from warp2protobuf.core.auth import get_jwt_token, update_env_file
 
         # 检查现有 token
         current_token = get_jwt_token()
 
-        if current_token and not is_token_expired(current_token, buffer_minutes=5):
+        if current_token and self._token_fresh(current_token):
             logger.info("现有 token 仍然有效")
             return current_token
 
@@ -645,8 +1017,8 @@ class MultiAccountTokenService:
 
         if new_token:
             # 保存新 token
-            from warp2protobuf.core.auth import update_env_file
-            update_env_file(new_token)
+            await update_env_file(new_token)
+            self._remember_token(new_token)
             return new_token
         else:
             raise RuntimeError("无法获取有效的 Warp 访问令牌")
@@ -659,8 +1031,8 @@ class MultiAccountTokenService:
         """
         return {
             "total_accounts": len(self.accounts),
-            "failed_accounts": len(self.failed_accounts),
-            "available_accounts": len(self.accounts) - len(self.failed_accounts),
+            "failed_accounts": self._failed_mask.bit_count(),
+            "available_accounts": len(self.accounts) - self._failed_mask.bit_count(),
             "current_index": self.current_index
         }
 
@@ -671,10 +1043,43 @@ _multi_account_service = None  # 缺失定义补齐
 
 # === 新增：后台保洁任务 ===
 _cleanup_task: Optional[asyncio.Task] = None
-_cleanup_manager: Optional[CloudflareWorkerManager] = None
+# 清理任务按账号复用管理器，保持与 Cloudflare API 的长连接
+_mgr_cache: Dict[str, CloudflareWorkerManager] = {}
+
+
+def _get_cleanup_manager(api_token: str, account_id: str, subdomain: str) -> CloudflareWorkerManager:
+    """获取（或创建）账号对应的清理用管理器"""
+    mgr = _mgr_cache.get(account_id)
+    if mgr is None or mgr.cf_api_token != api_token:
+        if mgr is not None:
+            # API Token 已更换：后台关闭旧管理器的连接
+            _track_background(asyncio.create_task(mgr.aclose()))
+        mgr = CloudflareWorkerManager(api_token, account_id, subdomain)
+        _mgr_cache[account_id] = mgr
+    return mgr
+
+
+# (环境签名, 账号列表)；环境变量未变化时直接复用解析结果
+_accounts_cache: Optional[Tuple[tuple, List[Dict[str, str]]]] = None
+
+
+def _cloudflare_env_signature() -> tuple:
+    """所有 CLOUDFLARE_* 环境变量组成的签名（覆盖 JSON、编号与单账号三种配置方式）"""
+    return tuple(sorted((k, v) for k, v in os.environ.items() if k.startswith("CLOUDFLARE_")))
 
 
 def _collect_accounts_from_env() -> List[Dict[str, str]]:
+    """收集 Cloudflare 账号配置（按环境签名缓存）。"""
+    global _accounts_cache
+    sig = _cloudflare_env_signature()
+    if _accounts_cache is not None and _accounts_cache[0] == sig:
+        return _accounts_cache[1]
+    accounts = _load_accounts_uncached()
+    _accounts_cache = (sig, accounts)
+    return accounts
+
+
+def _load_accounts_uncached() -> List[Dict[str, str]]:
     """收集 Cloudflare 账号配置：优先多账号，回退单账号。"""
     try:
         mats = MultiAccountTokenService()
@@ -689,35 +1094,85 @@ def _collect_accounts_from_env() -> List[Dict[str, str]]:
     return []
 
 
+# 跨账号并发清理时同时处理的账号数上限（Cloudflare 全局 API 限额约 1200 次/5 分钟）
+CLEANUP_ACCOUNT_CONCURRENCY = 8
+# 周期巡检的 Worker 数量缓存：数量远低于阈值时，缓存在这么多个巡检周期内有效，
+# 即每隔一个周期才真正 list 一次
+LIST_COUNT_CACHE_TICKS = 2
+LIST_COUNT_CACHE_MARGIN = 10
+_list_count_cache: Dict[str, Tuple[float, int]] = {}
+
+
+async def _cleanup_one(acc: Dict[str, str], prefix: str, sem: asyncio.Semaphore) -> Dict[str, Any]:
+    """清理单个账号下指定前缀的 Workers，异常不外抛"""
+    api_token = acc.get("api_token", "")
+    account_id = acc.get("account_id", "")
+    subdomain = acc.get("subdomain", "")
+    if not (api_token and account_id):
+        return {}
+    tag = account_id[:8]
+    async with sem:
+        mgr = _get_cleanup_manager(api_token, account_id, subdomain)
+        try:
+            stats = await mgr.cleanup_workers_by_prefix(prefix=prefix, threshold=None)
+            _list_count_cache.pop(account_id, None)
+            logger.info("账号 %s... 清理完成: %s", tag, stats)
+            return stats
+        except Exception as e:
+            logger.error("账号 %s... 启动清理异常: %s", tag, e)
+            return {}
+
+
 async def startup_cleanup(prefix: str = "warp-token-"):
-    """服务启动时清理所有指定前缀的残留 Workers（支持多账号遍历）。"""
+    """服务启动时清理所有指定前缀的残留 Workers（多账号并发）。"""
     accounts = _collect_accounts_from_env()
     if not accounts:
         logger.warning("startup_cleanup 跳过：未检测到任何 Cloudflare 账号配置")
         return
 
+    sem = asyncio.Semaphore(CLEANUP_ACCOUNT_CONCURRENCY)
+    results = await asyncio.gather(*[_cleanup_one(acc, prefix, sem) for acc in accounts], return_exceptions=True)
+
     total_deleted = 0
     total_matched = 0
-    for acc in accounts:
-        api_token = acc.get("api_token", "")
-        account_id = acc.get("account_id", "")
-        subdomain = acc.get("subdomain", "")
-        if not (api_token and account_id):
-            continue
-        mgr = CloudflareWorkerManager(api_token, account_id, subdomain)
-        try:
-            stats = await mgr.cleanup_workers_by_prefix(prefix=prefix, threshold=None)
+    for stats in results:
+        if isinstance(stats, dict):
             total_deleted += int(stats.get("deleted", 0))
             total_matched += int(stats.get("matched", 0))
-            logger.info(f"账号 {account_id[:8]}... 清理完成: {stats}")
-        except Exception as e:
-            logger.error(f"账号 {account_id[:8]}... 启动清理异常: {e}")
 
     logger.info(f"启动清理总计：匹配 {total_matched}，删除 {total_deleted}")
 
 
+async def _check_one(acc: Dict[str, str], prefix: str, threshold: int, sem: asyncio.Semaphore, cache_ttl: float):
+    """巡检单个账号，匹配数量达到阈值时清理，异常不外抛"""
+    api_token = acc.get("api_token", "")
+    account_id = acc.get("account_id", "")
+    subdomain = acc.get("subdomain", "")
+    if not (api_token and account_id):
+        return
+    tag = account_id[:8]
+    async with sem:
+        cached = _list_count_cache.get(account_id)
+        if cached and time.time() - cached[0] < cache_ttl and cached[1] < threshold - LIST_COUNT_CACHE_MARGIN:
+            logger.debug("周期检查：账号 %s... 缓存数量 %d 远低于阈值，跳过", tag, cached[1])
+            return
+        mgr = _get_cleanup_manager(api_token, account_id, subdomain)
+        try:
+            matching = _match_worker_names(await mgr.list_all_workers(), prefix)
+            count = len(matching)
+            _list_count_cache[account_id] = (time.time(), count)
+            logger.info("周期检查：账号 %s... 前缀 '%s' 数量 %d", tag, prefix, count)
+            if count >= threshold:
+                logger.warning("账号 %s... 达到阈值 %d，触发清理", tag, threshold)
+                # 直接删除刚列出的 Workers，不再重复 list
+                await mgr.delete_workers(matching)
+                _list_count_cache.pop(account_id, None)
+        except Exception as e:
+            logger.error("周期清理账号 %s... 时异常: %s", tag, e)
+
+
 async def _periodic_cleanup(prefix: str, threshold: int, interval_seconds: int):
-    """每 interval_seconds 轮询一次，对所有账号巡检并在超过阈值时清理。"""
+    """每 interval_seconds 轮询一次，对所有账号并发巡检并在超过阈值时清理。"""
     while True:
         try:
             # 获取账号集合
@@ -726,26 +1181,12 @@ async def _periodic_cleanup(prefix: str, threshold: int, interval_seconds: int):
             if not accounts:
                 logger.warning("周期清理跳过：未检测到任何 Cloudflare 账号配置")
             else:
-                for acc in accounts:
-                    api_token = acc.get("api_token", "")
-                    account_id = acc.get("account_id", "")
-                    subdomain = acc.get("subdomain", acc.get("subdomain", ""))
-                    if not (api_token and account_id):
-                        continue
-                    mgr = CloudflareWorkerManager(api_token, account_id, subdomain)
-                    try:
-                        workers = await mgr.list_all_workers()
-                        count = 0
-                        for w in workers:
-                            name = w.get("id") or w.get("name") or ""
-                            if isinstance(name, str) and name.startswith(prefix):
-                                count += 1
-                        logger.info(f"周期检查：账号 {account_id[:8]}... 前缀 '{prefix}' 数量 {count}")
-                        if count >= threshold:
-                            logger.warning(f"账号 {account_id[:8]}... 达到阈值 {threshold}，触发清理")
-                            await mgr.cleanup_workers_by_prefix(prefix=prefix, threshold=None)
-                    except Exception as e:
-                        logger.error(f"周期清理账号 {account_id[:8]}... 时异常: {e}")
+                sem = asyncio.Semaphore(CLEANUP_ACCOUNT_CONCURRENCY)
+                cache_ttl = interval_seconds * LIST_COUNT_CACHE_TICKS
+                await asyncio.gather(
+                    *[_check_one(acc, prefix, threshold, sem, cache_ttl) for acc in accounts],
+                    return_exceptions=True,
+                )
         except Exception as e:
             logger.error(f"周期清理任务异常: {e}")
         finally:
@@ -781,7 +1222,7 @@ def get_token_service():
     # 优先：多账号服务（从环境变量自动加载），成功则复用返回
     if _multi_account_service is None:
         try:
-            _multi_account_service = MultiAccountTokenService()
+            _multi_account_service = MultiAccountTokenService(client=get_shared_worker_client())
             logger.info(f"使用多账号 Token 服务 ({len(_multi_account_service.accounts)} 个账号)")
             return _multi_account_service
         except ValueError:
@@ -795,12 +1236,35 @@ def get_token_service():
         cf_account_id = os.getenv("CLOUDFLARE_ACCOUNT_ID")
         if not cf_api_token or not cf_account_id:
             raise ValueError("需要设置环境变量: CLOUDFLARE_API_TOKEN 和 CLOUDFLARE_ACCOUNT_ID，或配置多账号")
-        _token_service = WarpTokenService(cf_api_token, cf_account_id)
+        _token_service = WarpTokenService(cf_api_token, cf_account_id, client=get_shared_worker_client())
         logger.info("使用单账号 Token 服务")
 
     return _token_service
 
 
+async def shutdown_token_services():
+    """服务关闭时调用：停止周期清理，删除常驻 Worker，等待后台删除完成并关闭连接"""
+    global _cleanup_task
+    # 先停周期清理，避免其在连接关闭后重建管理器并发起请求
+    task, _cleanup_task = _cleanup_task, None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await teardown_persistent_workers()
+    await flush_pending_deletions()
+    if _multi_account_service is not None:
+        await _multi_account_service.aclose()
+    if _token_service is not None:
+        await _token_service.aclose()
+    managers = list(_mgr_cache.values())
+    _mgr_cache.clear()
+    await asyncio.gather(*[m.aclose() for m in managers], return_exceptions=True)
+    await close_shared_worker_client()
+
+
 async def get_fresh_warp_token() -> str:
     """
     便捷函数：获取新的 Warp token
@@ -14,15 +14,27 @@ Warp Token 池管理系统
 """
 
 import asyncio
+import heapq
+import itertools
+import os
+import random
 import time
-from typing import Optional, List, Dict, Any
-from dataclasses import dataclass
+from collections import deque
+from typing import Optional, List, Dict, Any, Set, Deque, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
-import threading
-from concurrent.futures import ThreadPoolExecutor
 
+from warp2protobuf.core.auth import decode_jwt_payload
 from warp2protobuf.core.logging import logger
-from warp_token_manager import WarpTokenService
+from warp_token_manager import MultiAccountTokenService, WarpTokenService, get_shared_worker_client
+
+
+# token 在 exp 前多少秒视为过期（与 TokenInfo.is_expired 默认值一致）
+EXPIRY_BUFFER_SECONDS = 5 * 60
+# 池中没有 token 时维护任务的最长睡眠时间
+MAINTENANCE_IDLE_SECONDS = 60
+# 创建 token 重试退避上限（秒）
+MAX_RETRY_BACKOFF_SECONDS = 30
 
 
 class TokenStatus(Enum):
@@ -33,7 +45,7 @@ class TokenStatus(Enum):
     UNKNOWN = "unknown"
 
 
-@dataclass
+@dataclass(slots=True)
 class TokenInfo:
     """Token 信息"""
     token: str
@@ -41,11 +53,16 @@ class TokenInfo:
     last_used: float
     use_count: int
     status: TokenStatus
+    # JWT exp（unix 时间戳），创建时解析一次；无 exp 时为 0，视为已过期
+    exp_ts: float = field(init=False, default=0.0)
+
+    def __post_init__(self):
+        exp = decode_jwt_payload(self.token).get("exp")
+        self.exp_ts = float(exp) if exp is not None else 0.0
 
     def is_expired(self, buffer_minutes: int = 5) -> bool:
         """检查 token 是否过期"""
-        from warp2protobuf.core.auth import is_token_expired
-        return is_token_expired(self.token, buffer_minutes)
+        return time.time() + buffer_minutes * 60 >= self.exp_ts
 
     def age_hours(self) -> float:
         """获取 token 年龄（小时）"""
@@ -72,46 +89,30 @@ class WarpTokenPool:
             cf_account_id: 单个 Cloudflare Account ID（向后兼容）
             pool_size: 池大小（建议 2-3 个）
         """
-        # 尝试使用多账号服务
-        self.token_service = None
-        self.use_multi_account = False
-
-        try:
-            # 优先尝试初始化多账号服务
-            from warp_token_manager import MultiAccountTokenService
-            multi_service = MultiAccountTokenService()  # 会从环境变量加载配置
-            stats = multi_service.get_stats()
-
-            if stats['total_accounts'] > 1:
-                logger.info(f"使用多账号模式，共有 {stats['total_accounts']} 个账号")
-                self.token_service = multi_service
-                self.use_multi_account = True
-            else:
-                logger.info("只有一个账号，使用单账号模式")
-                # 回退到单账号模式
-                if not cf_api_token or not cf_account_id:
-                    # 从环境变量获取
-                    import os
-                    cf_api_token = cf_api_token or os.getenv("CLOUDFLARE_API_TOKEN")
-                    cf_account_id = cf_account_id or os.getenv("CLOUDFLARE_ACCOUNT_ID")
-
-                from warp_token_manager import WarpTokenService
-                self.token_service = WarpTokenService(cf_api_token, cf_account_id)
-
-        except Exception as e:
-            logger.warning(f"初始化多账号服务失败: {e}，使用单账号模式")
-            # 回退到单账号模式
-            if not cf_api_token or not cf_account_id:
-                import os
-                cf_api_token = cf_api_token or os.getenv("CLOUDFLARE_API_TOKEN")
-                cf_account_id = cf_account_id or os.getenv("CLOUDFLARE_ACCOUNT_ID")
-
-            from warp_token_manager import WarpTokenService
-            self.token_service = WarpTokenService(cf_api_token, cf_account_id)
+        self.token_service, self.use_multi_account = self._build_service(cf_api_token, cf_account_id)
         self.pool_size = pool_size
-        self.tokens: List[TokenInfo] = []
+        # token 登记表：达到 pool_size*2 时先淘汰过期/受限记录再追加，可用 token 永不被挤出
+        self.tokens: Deque[TokenInfo] = deque()
+        self._tokens_cap = pool_size * 2
+        # 可用 token 队列（按创建顺序），队头即下一个使用的 token
+        self._valid: deque = deque()
         self.lock = asyncio.Lock()
+        # 池内派生的所有任务，stop() 时统一取消，避免停止后仍有孤儿任务
+        self._tasks: Set[asyncio.Task] = set()
         self.background_task: Optional[asyncio.Task] = None
+        # 单个常驻补充协程，热路径只需 set 事件
+        self._refill_task: Optional[asyncio.Task] = None
+        self._need_refill = asyncio.Event()
+        # 启动填充：第一个 token 入池即置位，启动流程无需等最慢的 token
+        self._fill_task: Optional[asyncio.Task] = None
+        self._first_token_ready = asyncio.Event()
+        self._emergency_future: Optional[asyncio.Future] = None
+        # 正在进行中的后台 token 创建数
+        self._inflight_creates: int = 0
+        # 过期时间小顶堆 (失效时刻, 序号, token)，维护任务睡到最早失效的 token 为止
+        self._expiry_heap: List[tuple] = []
+        self._heap_seq = itertools.count()
+        self._wake = asyncio.Event()
         self.is_running = False
 
         # 统计信息
@@ -122,6 +123,30 @@ class WarpTokenPool:
             "rate_limit_hits": 0
         }
 
+    @staticmethod
+    def _build_service(cf_api_token: Optional[str], cf_account_id: Optional[str]) -> Tuple[Any, bool]:
+        """构建 token 服务：多账号优先，失败或只有一个账号时回退单账号
+
+        Returns:
+            (token 服务, 是否为多账号模式)
+        """
+        client = get_shared_worker_client()
+        try:
+            # 会从环境变量加载配置；各账号共享 workers.dev 连接
+            multi_service = MultiAccountTokenService(client=client)
+            total = multi_service.get_stats()['total_accounts']
+            if total > 1:
+                logger.info(f"使用多账号模式，共有 {total} 个账号")
+                return multi_service, True
+            logger.info("只有一个账号，使用单账号模式")
+        except Exception as e:
+            logger.warning(f"初始化多账号服务失败: {e}，使用单账号模式")
+
+        # 回退到单账号模式，未显式提供时从环境变量获取
+        cf_api_token = cf_api_token or os.getenv("CLOUDFLARE_API_TOKEN")
+        cf_account_id = cf_account_id or os.getenv("CLOUDFLARE_ACCOUNT_ID")
+        return WarpTokenService(cf_api_token, cf_account_id, client=client), False
+
     async def start(self):
         """启动 Token 池管理"""
         if self.is_running:
@@ -130,11 +155,15 @@ class WarpTokenPool:
         logger.info("启动 Token 池管理系统...")
         self.is_running = True
 
-        # 初始化填充池
-        await self._fill_pool()
+        # 初始化填充池：只等到第一个 token 可用（或填充结束），其余在后台继续
+        self._fill_task = self._spawn(self._fill_pool())
+        ready_waiter = asyncio.create_task(self._first_token_ready.wait())
+        await asyncio.wait({self._fill_task, ready_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        ready_waiter.cancel()
 
-        # 启动后台维护任务
-        self.background_task = asyncio.create_task(self._background_maintenance())
+        # 启动后台维护与补充任务
+        self.background_task = self._spawn(self._background_maintenance())
+        self._refill_task = self._spawn(self._refill_worker())
 
         logger.info(f"Token 池启动成功，当前池大小: {len(self.tokens)}")
 
@@ -142,16 +171,23 @@ class WarpTokenPool:
         """停止 Token 池管理"""
         logger.info("停止 Token 池管理系统...")
         self.is_running = False
+        self._wake.set()
 
-        if self.background_task:
-            self.background_task.cancel()
-            try:
-                await self.background_task
-            except asyncio.CancelledError:
-                pass
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
 
         logger.info("Token 池管理系统已停止")
 
+    def _spawn(self, coro) -> asyncio.Task:
+        """创建受池管理的任务，完成后自动移出集合"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
     async def get_valid_token(self) -> str:
         """
         获取有效的 token
@@ -162,38 +198,47 @@ class WarpTokenPool:
         Raises:
             RuntimeError: 无法获取有效 token
         """
-        async with self.lock:
-            self.stats["total_requests"] += 1
+        self.stats["total_requests"] += 1
 
-            # 查找有效的 token
-            valid_token = await self._find_valid_token()
+        # 快速路径不加锁：查找过程中没有 await，事件循环内对其他协程是原子的
+        valid_token = await self._find_valid_token()
+        if valid_token:
+            return self._use_pooled_token(valid_token)
 
+        async with self.lock:
+            # 等锁期间可能已有其他协程补充了 token
+            valid_token = await self._find_valid_token()
             if valid_token:
-                # 更新使用信息
-                valid_token.last_used = time.time()
-                valid_token.use_count += 1
+                return self._use_pooled_token(valid_token)
 
-                logger.debug(f"使用池中 token，使用次数: {valid_token.use_count}")
+            # 池中没有有效 token，紧急处理
+            logger.warning("池中无有效 token，触发紧急补充...")
 
-                # 触发后台补充（如果需要）
-                asyncio.create_task(self._ensure_pool_health())
+        # 1. 在锁外紧急获取一个 token 用于当前请求：并发的等待方共享同一次获取，
+        #    获取期间也不阻塞 429 切换与后台入池
+        emergency_token = await self._get_emergency_token()
 
-                return valid_token.token
+        # 2. 同时触发池的完整补充（补充到满池）
+        self._need_refill.set()
 
-            # 池中没有有效 token，紧急处理
-            logger.warning("池中无有效 token，触发紧急补充...")
+        if emergency_token:
+            logger.info("紧急 token 获取成功，后台正在补充池")
+            return emergency_token
+        else:
+            raise RuntimeError("无法获取有效的 Warp 访问令牌")
+
+    def _use_pooled_token(self, valid_token: TokenInfo) -> str:
+        """记录池中 token 的使用并返回"""
+        # 更新使用信息
+        valid_token.last_used = time.time()
+        valid_token.use_count += 1
 
-            # 1. 先紧急获取一个 token 用于当前请求
-            emergency_token = await self._get_emergency_token()
+        logger.debug("使用池中 token，使用次数: %d", valid_token.use_count)
 
-            # 2. 同时触发池的完整补充（补充到满池）
-            asyncio.create_task(self._ensure_pool_health())
+        # 触发后台补充（如果需要）
+        self._need_refill.set()
 
-            if emergency_token:
-                logger.info("紧急 token 获取成功，后台正在补充池")
-                return emergency_token
-            else:
-                raise RuntimeError("无法获取有效的 Warp 访问令牌")
+        return valid_token.token
 
     async def handle_rate_limit(self, failed_token: str) -> Optional[str]:
         """
@@ -209,9 +254,11 @@ class WarpTokenPool:
             self.stats["rate_limit_hits"] += 1
 
             # 标记失败的 token
-            for token_info in self.tokens:
+            for token_info in self._valid:
                 if token_info.token == failed_token:
                     token_info.status = TokenStatus.RATE_LIMITED
+                    self._valid.remove(token_info)
+                    self._wake.set()
                     logger.warning(f"Token 遇到 429，标记为受限: {failed_token[:50]}...")
                     break
 
@@ -225,33 +272,55 @@ class WarpTokenPool:
 
                 logger.info(f"成功切换到备用 token: {backup_token.token[:50]}...")
 
+                # 预热：备用 token 也可能很快受限，立即并行创建一个替补
+                if self._inflight_creates < self.pool_size:
+                    self._start_create()
+
                 # 异步补充池
-                asyncio.create_task(self._ensure_pool_health())
+                self._need_refill.set()
 
                 return backup_token.token
 
             # 没有备用 token，紧急获取并触发池补充
             logger.error("没有备用 token，触发紧急补充...")
 
-            # 1. 紧急获取一个 token
-            emergency_token = await self._get_emergency_token()
+        # 1. 在锁外紧急获取一个 token（与 get_valid_token 共享同一次获取）
+        emergency_token = await self._get_emergency_token()
 
-            # 2. 触发池的完整补充
-            asyncio.create_task(self._ensure_pool_health())
+        # 2. 触发池的完整补充
+        self._need_refill.set()
 
-            if emergency_token:
-                logger.info("紧急 token 获取成功，后台正在补充池")
+        if emergency_token:
+            logger.info("紧急 token 获取成功，后台正在补充池")
 
-            return emergency_token
+        return emergency_token
+
+    def _add_token(self, token_info: TokenInfo):
+        """登记新 token；有效的同时放入可用队列"""
+        if len(self.tokens) >= self._tokens_cap:
+            # 只淘汰已过期或受限的记录，仍可用的 token 不会被挤出
+            self.tokens = deque(t for t in self.tokens if t.status is TokenStatus.VALID and not t.is_expired())
+        self.tokens.append(token_info)
+        if token_info.status is TokenStatus.VALID:
+            self._valid.append(token_info)
+            self._first_token_ready.set()
+            deadline = token_info.exp_ts - EXPIRY_BUFFER_SECONDS
+            heapq.heappush(self._expiry_heap, (deadline, next(self._heap_seq), token_info))
+            self._wake.set()
+
+    def _prune_expired_head(self):
+        """弹出队头已过期的 token（按创建顺序，最早过期的在队头）"""
+        while self._valid and self._valid[0].is_expired():
+            self._valid.popleft().status = TokenStatus.EXPIRED
 
     async def _find_valid_token(self, exclude_token: Optional[str] = None) -> Optional[TokenInfo]:
         """查找有效的 token"""
-        for token_info in self.tokens:
-            if exclude_token and token_info.token == exclude_token:
-                continue
+        self._prune_expired_head()
+        if not exclude_token:
+            return self._valid[0] if self._valid else None
 
-            if (token_info.status == TokenStatus.VALID and
-                not token_info.is_expired()):
+        for token_info in self._valid:
+            if token_info.token != exclude_token and not token_info.is_expired():
                 return token_info
 
         return None
@@ -260,48 +329,74 @@ class WarpTokenPool:
         """填充 token 池"""
         logger.info(f"开始填充 Token 池，目标大小: {self.pool_size}")
 
-        tasks = []
-        needed = self.pool_size - len([t for t in self.tokens if t.status == TokenStatus.VALID])
-
-        for i in range(needed):
-            task = asyncio.create_task(self._create_token_with_retry())
-            tasks.append(task)
-
-        # 并发创建 token
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        needed = max(0, self.pool_size - len(self._valid))
+        tasks = [self._spawn(self._create_token_with_retry()) for _ in range(needed)]
+        # 填充中的创建计入进行中计数，首个 token 触发的补充检查不会重复创建
+        self._inflight_creates += needed
+        settled = 0
 
+        # 并发创建 token，每完成一个立即入池
         success_count = 0
-        for result in results:
-            if isinstance(result, str):  # 成功获取的 token
-                token_info = TokenInfo(
-                    token=result,
-                    created_at=time.time(),
-                    last_used=0,
-                    use_count=0,
-                    status=TokenStatus.VALID
-                )
-                self.tokens.append(token_info)
-                success_count += 1
-                self.stats["tokens_created"] += 1
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    result = await next_done
+                except Exception as e:
+                    logger.error(f"填充 token 失败: {e}")
+                    continue
+                finally:
+                    # 与下方入池之间没有 await，计数与有效数对其他协程保持一致
+                    settled += 1
+                    self._inflight_creates -= 1
+                if isinstance(result, str):  # 成功获取的 token
+                    token_info = TokenInfo(
+                        token=result,
+                        created_at=time.time(),
+                        last_used=0,
+                        use_count=0,
+                        status=TokenStatus.VALID
+                    )
+                    self._add_token(token_info)
+                    success_count += 1
+                    self.stats["tokens_created"] += 1
+        finally:
+            self._inflight_creates -= needed - settled
+            # 填充被取消（stop）时一并取消未完成的创建
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
 
         logger.info(f"Token 池填充完成，成功创建: {success_count}/{needed}")
 
     async def _create_token_with_retry(self, max_retries: int = 2) -> Optional[str]:
         """创建 token，带重试机制"""
         for attempt in range(max_retries):
+            retry_after = None
             try:
                 token = await self.token_service.acquire_fresh_token()
                 if token:
                     return token
             except Exception as e:
                 logger.error(f"创建 token 失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2 ** attempt)  # 指数退避
+                retry_after = getattr(e, "retry_after", None)
+            if attempt < max_retries - 1:
+                # 全抖动指数退避，避免并发重试同步碰撞；服务端给出 Retry-After 时以其为下限
+                delay = random.uniform(0, min(MAX_RETRY_BACKOFF_SECONDS, 2 ** attempt))
+                if retry_after:
+                    delay = max(delay, min(MAX_RETRY_BACKOFF_SECONDS, float(retry_after)))
+                await asyncio.sleep(delay)
 
         return None
 
     async def _get_emergency_token(self) -> Optional[str]:
-        """紧急获取 token"""
+        """紧急获取 token（并发调用共享同一次获取）"""
+        if self._emergency_future is None or self._emergency_future.done():
+            self._emergency_future = self._spawn(self._do_create_emergency())
+        # shield: 单个等待方被取消时不中断共享的获取
+        return await asyncio.shield(self._emergency_future)
+
+    async def _do_create_emergency(self) -> Optional[str]:
+        """实际执行紧急 token 获取"""
         try:
             token = await self.token_service.acquire_fresh_token()
             if token:
@@ -313,7 +408,7 @@ class WarpTokenPool:
                     use_count=1,
                     status=TokenStatus.VALID
                 )
-                self.tokens.append(token_info)
+                self._add_token(token_info)
                 self.stats["tokens_created"] += 1
 
                 logger.info("紧急获取 token 成功")
@@ -329,14 +424,22 @@ class WarpTokenPool:
 
         while self.is_running:
             try:
-                await asyncio.sleep(30)  # 每 30 秒检查一次
+                # 睡到最早的 token 失效，或有 token 新增/受限时被唤醒
+                heap = self._expiry_heap
+                sleep_for = max(0.0, heap[0][0] - time.time()) if heap else MAINTENANCE_IDLE_SECONDS
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=sleep_for)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
 
                 if not self.is_running:
                     break
 
                 async with self.lock:
                     await self._cleanup_invalid_tokens()
-                    await self._ensure_pool_health()
+                    self._prune_expiry_heap()
+                self._need_refill.set()
 
             except asyncio.CancelledError:
                 break
@@ -346,45 +449,75 @@ class WarpTokenPool:
 
         logger.info("后台维护任务已停止")
 
+    def _prune_expiry_heap(self):
+        """弹出已到期或已不在可用队列中的堆顶条目"""
+        heap = self._expiry_heap
+        now = time.time()
+        while heap and (heap[0][0] <= now or heap[0][2].status is not TokenStatus.VALID):
+            heapq.heappop(heap)
+
+    async def _refill_worker(self):
+        """常驻补充协程：等待补充信号，逐次执行池健康检查（创建任务在后台进行，由进行中计数去重）"""
+        while self.is_running:
+            try:
+                await self._need_refill.wait()
+                self._need_refill.clear()
+                await self._ensure_pool_health()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Token 补充任务错误: {e}")
+
     async def _cleanup_invalid_tokens(self):
         """清理无效的 token"""
         before_count = len(self.tokens)
 
         # 移除过期或受限的 token
-        self.tokens = [
-            t for t in self.tokens
-            if (t.status == TokenStatus.VALID and not t.is_expired())
-        ]
+        self._prune_expired_head()
+        self._valid = deque(t for t in self._valid if not t.is_expired())
+        self.tokens = deque(self._valid)
 
         removed_count = before_count - len(self.tokens)
         if removed_count > 0:
-            logger.debug(f"清理了 {removed_count} 个无效 token")
+            logger.debug("清理了 %d 个无效 token", removed_count)
 
     async def _ensure_pool_health(self):
         """确保池的健康状态 - 当有效 token 少于一半时立即补充"""
-        valid_count = len([t for t in self.tokens
-                          if t.status == TokenStatus.VALID and not t.is_expired()])
+        self._prune_expired_head()
+        valid_count = len(self._valid)
+        # 进行中的创建（如 429 预热）也计入，避免并发触发时重复补充
+        effective_valid = valid_count + self._inflight_creates
 
         # 计算补充阈值：池大小的一半（向上取整）
         threshold = (self.pool_size + 1) // 2
 
         # 当有效 token 数量少于或等于阈值时，立即补充到满池
-        if valid_count <= threshold:
-            needed = self.pool_size - valid_count
+        if effective_valid <= threshold:
+            needed = max(0, self.pool_size - effective_valid)
             logger.info(f"Token 池健康度低于 50% (当前: {valid_count}/{self.pool_size})，补充 {needed} 个 token")
 
-            # 异步创建新 token
+            # 派生后台创建任务即返回：_start_create 已同步计入进行中数量，
+            # 补充协程不必等待创建完成，可继续响应后续补充信号
             for _ in range(needed):
-                asyncio.create_task(self._create_and_add_token())
+                self._start_create()
         else:
-            logger.debug(f"Token 池健康 (有效: {valid_count}/{self.pool_size})")
+            logger.debug("Token 池健康 (有效: %d/%d)", valid_count, self.pool_size)
+
+    def _start_create(self) -> asyncio.Task:
+        """派生一个后台创建任务；计数在派生时同步增加，任务尚未运行时也已计入"""
+        self._inflight_creates += 1
+        return self._spawn(self._create_and_add_token())
 
     async def _create_and_add_token(self):
-        """创建并添加新 token 到池中"""
+        """创建并添加新 token 到池中（由 _start_create 派生，结束时归还计数）"""
         try:
             token = await self._create_token_with_retry()
             if token:
                 async with self.lock:
+                    # 紧急获取等并发路径已把池补满时不再入池
+                    if len(self._valid) >= self.pool_size:
+                        logger.debug("Token 池已满，丢弃后台新建的 token")
+                        return
                     token_info = TokenInfo(
                         token=token,
                         created_at=time.time(),
@@ -392,23 +525,33 @@ class WarpTokenPool:
                         use_count=0,
                         status=TokenStatus.VALID
                     )
-                    self.tokens.append(token_info)
+                    self._add_token(token_info)
                     self.stats["tokens_created"] += 1
 
-                    logger.debug(f"后台添加新 token 到池中，当前池大小: {len(self.tokens)}")
+                    logger.debug("后台添加新 token 到池中，当前池大小: %d", len(self.tokens))
         except Exception as e:
             logger.error(f"后台创建 token 失败: {e}")
+        finally:
+            self._inflight_creates -= 1
 
     def get_stats(self) -> Dict[str, Any]:
-        """获取统计信息"""
-        valid_tokens = [t for t in self.tokens if t.status == TokenStatus.VALID]
+        """获取统计信息（单次遍历）"""
+        now = time.time()
+        valid_count = 0
+        age_sum = 0.0
+        total_uses = 0
+        for t in self.tokens:
+            total_uses += t.use_count
+            if t.status is TokenStatus.VALID:
+                valid_count += 1
+                age_sum += now - t.created_at
 
         return {
             **self.stats,
             "pool_size": len(self.tokens),
-            "valid_tokens": len(valid_tokens),
-            "average_token_age": sum(t.age_hours() for t in valid_tokens) / len(valid_tokens) if valid_tokens else 0,
-            "total_token_uses": sum(t.use_count for t in self.tokens)
+            "valid_tokens": valid_count,
+            "average_token_age": age_sum / 3600 / valid_count if valid_count else 0,
+            "total_token_uses": total_uses
         }
 
 
@@ -424,8 +567,6 @@ async def get_token_pool() -> WarpTokenPool:
     global _token_pool
 
     if _token_pool is None:
-        import os
-
         # 不再强制要求单账号配置，让 WarpTokenPool 自己判断
         # WarpTokenPool 会自动尝试多账号模式，如果失败则回退到单账号
         _token_pool = WarpTokenPool()
@@ -434,6 +575,17 @@ async def get_token_pool() -> WarpTokenPool:
     return _token_pool
 
 
+async def shutdown_token_pool():
+    """服务关闭时调用：先停止池内所有任务，再删除池自己的常驻 Worker 并关闭连接"""
+    global _token_pool
+    pool = _token_pool
+    if pool is None:
+        return
+    _token_pool = None
+    await pool.stop()
+    await pool.token_service.aclose()
+
+
 async def get_pooled_token() -> str:
     """便捷函数：从池中获取 token"""
     pool = await get_token_pool()